@@ -0,0 +1,513 @@
+#!/usr/bin/env python
+# -*- coding : iso-8859-1 -*-
+"""
+    bench_pyfind_revdep - reproducible benchmark of pyfind_revdep scans
+    on a synthetic system tree.
+
+    Copyright (C) 2009  LukenShiro <lukenshiro@ngi.it>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, version 3 of the License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    For every requested scale a fake root is generated (ELF binaries and
+    libraries with a seeded dependency graph, broken links, symlink farms,
+    ld.so.conf, /var/log/packages records, slackpkg filelists and sbopkg
+    directories) and the main phases of a scan are timed. Results are
+    written as JSON; with '--baseline' they are compared against a
+    previous run and slower phases are reported.
+"""
+
+import os
+import sys
+import time
+import random
+import struct
+import gzip
+import shutil
+import getopt
+import platform
+import tempfile
+try:
+    import json
+except ImportError:
+    json = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pyfind_revdep
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+LIBDIRS = ["lib64", "usr/lib64"]
+BINDIRS = ["bin", "usr/bin"]
+APPDIR = "opt/app"
+
+STANDIN_LDD = '''#!%(python)s
+""" ldd stand-in for synthetic files: same output format as ldd, no
+    execution of the checked files.
+"""
+import sys
+sys.path.insert(0, %(moddir)r)
+import pyfind_revdep
+
+scanner = pyfind_revdep.FindRevDep()
+scanner.ldsoconf = %(ldsoconf)r
+scanner.ldsocache = %(ldsocache)r
+rtnval = 0
+for filename in sys.argv[1:]:
+    if len(sys.argv) > 2:
+        print filename + ":"
+    list_solibs = scanner.get_native_sodep(filename)
+    if not list_solibs:
+        sys.stderr.write("\\tnot a dynamic executable\\n")
+        rtnval = 1
+        continue
+    print "\\tlinux-vdso.so.1 (0x00007fff00000000)"
+    for soname, libpath in list_solibs:
+        if libpath.startswith("not"):
+            print "\\t%%s => not found" %% soname
+        else:
+            print "\\t%%s => %%s (0x0000000000000000)" %% (soname, libpath)
+    print "\\t/lib64/ld-linux-x86-64.so.2 (0x00007fff00001000)"
+sys.exit(rtnval)
+'''
+
+
+def make_elf(filename, needed, soname=None, rpath=None, executable=True,
+             runpath=True):
+    """ Writes a minimal x86_64 ELF file whose dynamic section lists
+        'needed' libraries; 'rpath' is written as DT_RUNPATH, or as
+        DT_RPATH if 'runpath' is False
+    """
+
+    strtab = "\0"
+    stroffsets = {}
+    for value in list(needed) + [soname, rpath]:
+        if value and value not in stroffsets:
+            stroffsets[value] = len(strtab)
+            strtab += value + "\0"
+    interp = ""
+    if executable:
+        interp = "/lib64/ld-linux-x86-64.so.2\0"
+    baseaddr = 0x400000
+    nphdrs = 2 + (interp and 1 or 0)
+    interp_off = 64 + 56 * nphdrs
+    dynentries = [(pyfind_revdep.DT_NEEDED, stroffsets[name]) for name in
+                  needed]
+    if soname:
+        dynentries.append((pyfind_revdep.DT_SONAME, stroffsets[soname]))
+    if rpath and runpath:
+        dynentries.append((pyfind_revdep.DT_RUNPATH, stroffsets[rpath]))
+    elif rpath:
+        dynentries.append((pyfind_revdep.DT_RPATH, stroffsets[rpath]))
+    dyn_off = interp_off + len(interp)
+    dyn_off += (8 - dyn_off % 8) % 8
+    strtab_off = dyn_off + 16 * (len(dynentries) + 3)
+    dynentries.extend([(pyfind_revdep.DT_STRTAB, baseaddr + strtab_off),
+                       (pyfind_revdep.DT_STRSZ, len(strtab)),
+                       (pyfind_revdep.DT_NULL, 0)])
+    filesize = strtab_off + len(strtab)
+    if executable:
+        etype = pyfind_revdep.ET_EXEC
+    else:
+        etype = pyfind_revdep.ET_DYN
+    ident = "\x7fELF" + chr(pyfind_revdep.ELFCLASS64) + \
+            chr(pyfind_revdep.ELFDATA2LSB) + "\x01" + "\0" * 9
+    data = [ident, struct.pack("<HHIQQQIHHHHHH", etype, 62, 1, 0, 64, 0, 0,
+                               64, 56, nphdrs, 64, 0, 0)]
+    data.append(struct.pack("<IIQQQQQQ", pyfind_revdep.PT_LOAD, 5, 0,
+                            baseaddr, baseaddr, filesize, filesize, 0x1000))
+    if interp:
+        data.append(struct.pack("<IIQQQQQQ", pyfind_revdep.PT_INTERP, 4,
+                                interp_off, baseaddr + interp_off,
+                                baseaddr + interp_off, len(interp),
+                                len(interp), 1))
+    data.append(struct.pack("<IIQQQQQQ", pyfind_revdep.PT_DYNAMIC, 6,
+                            dyn_off, baseaddr + dyn_off, baseaddr + dyn_off,
+                            16 * len(dynentries), 16 * len(dynentries), 8))
+    data.append(interp)
+    data.append("\0" * (dyn_off - interp_off - len(interp)))
+    for d_tag, d_val in dynentries:
+        data.append(struct.pack("<qQ", d_tag, d_val))
+    data.append(strtab)
+    handl = open(filename, "wb")
+    handl.write("".join(data))
+    handl.close()
+    os.chmod(filename, 0755)
+
+
+def make_sysroot(sysroot, nfiles, seed):
+    """ Generates a synthetic tree of about 'nfiles' files under 'sysroot'
+        -> dict of generation counters
+    """
+
+    rand = random.Random(seed)
+    for singdir in LIBDIRS + BINDIRS + [APPDIR + "/bin", APPDIR + "/lib",
+                                        "etc", "var/log/packages",
+                                        "var/lib/slackpkg"]:
+        os.makedirs(os.path.join(sysroot, singdir))
+    nlibs = max(4, nfiles / 5)
+    nbins = max(4, nfiles / 5)
+    nother = max(4, nfiles - nlibs * 3 - nbins)
+    counters = {"libraries": nlibs, "binaries": nbins, "other": nother,
+                "missing_libraries": 0, "dangling_symlinks": 0}
+    sonames = ["libsyn%d.so.%d" % (idx, idx % 3) for idx in range(nlibs)]
+    # removed libraries are taken among the less used ones
+    missing = set(rand.sample(range(nlibs / 2, nlibs), max(1, nlibs / 100)))
+    counters["missing_libraries"] = len(missing)
+    packages = {}
+    for idx in range(nlibs):
+        libdir = LIBDIRS[idx % len(LIBDIRS)]
+        if idx % 50 == 0:
+            libdir = APPDIR + "/lib"
+        # libraries of APPDIR (idx % 50 == 0) are only found by its own
+        # binaries, through their $ORIGIN runpath
+        needed = [sonames[dep] for dep in
+                  rand.sample(range(idx), min(idx, rand.randint(0, 3)))
+                  if dep % 50]
+        realname = sonames[idx] + ".0.0"
+        pkgname = "syn%d-1.0-x86_64-1" % (idx / 20)
+        packages.setdefault(pkgname, []).append(libdir + "/" + realname)
+        if idx in missing:
+            # removed library, leaves a dangling development symlink
+            os.symlink(realname, os.path.join(sysroot, libdir,
+                                              sonames[idx].split(".so")[0] +
+                                              ".so"))
+            counters["dangling_symlinks"] += 1
+            continue
+        make_elf(os.path.join(sysroot, libdir, realname), needed,
+                 soname=sonames[idx], executable=False)
+        os.symlink(realname, os.path.join(sysroot, libdir, sonames[idx]))
+        os.symlink(realname, os.path.join(sysroot, libdir,
+                                          sonames[idx].split(".so")[0] +
+                                          ".so"))
+    for idx in range(nbins):
+        bindir = BINDIRS[idx % len(BINDIRS)]
+        rpath = None
+        needed = [sonames[dep] for dep in
+                  rand.sample(range(nlibs), min(nlibs, rand.randint(1, 6)))
+                  if dep % 50]
+        if idx % 50 == 0:
+            bindir = APPDIR + "/bin"
+            rpath = "$ORIGIN/../lib"
+            needed.append(sonames[(idx * 7) % ((nlibs + 49) / 50) * 50])
+        binname = "synbin%d" % idx
+        make_elf(os.path.join(sysroot, bindir, binname), needed, rpath=rpath)
+        pkgname = "synapp%d-1.0-x86_64-1" % (idx / 20)
+        packages.setdefault(pkgname, []).append(bindir + "/" + binname)
+    for idx in range(nother):
+        if idx % 2:
+            othername = os.path.join(BINDIRS[idx % len(BINDIRS)],
+                                     "script%d.sh" % idx)
+        else:
+            othername = os.path.join(LIBDIRS[idx % len(LIBDIRS)],
+                                     "data%d.txt" % idx)
+        handl = open(os.path.join(sysroot, othername), "w")
+        handl.write("#!/bin/sh\necho %d\n" % idx)
+        handl.close()
+        os.chmod(os.path.join(sysroot, othername), 0755)
+    handl = open(os.path.join(sysroot, "etc/ld.so.conf"), "w")
+    for libdir in LIBDIRS:
+        handl.write(os.path.join(sysroot, libdir) + "\n")
+    handl.close()
+    handl = open(os.path.join(sysroot, "etc/slackware-version"), "w")
+    handl.write("Slackware 13.0\n")
+    handl.close()
+    list_pkgs = sorted(packages)
+    for pkgname in list_pkgs:
+        handl = open(os.path.join(sysroot, "var/log/packages", pkgname), "w")
+        handl.write("PACKAGE NAME:     %s\nFILE LIST:\n./\n" % pkgname)
+        for singfile in packages[pkgname]:
+            handl.write(singfile + "\n")
+        handl.close()
+    filelists = {"slackware64": [], "patches": [], "extra": [],
+                 "testing": []}
+    for pkgname in list_pkgs:
+        if rand.random() < 0.7:
+            section = "slackware64"
+        else:
+            section = rand.choice(["patches", "extra", "testing"])
+        filelists[section].append("./%s/l/%s.txz %s" % (section, pkgname,
+                                  " ".join(packages[pkgname])))
+    for section in filelists:
+        gzhandl = gzip.open(os.path.join(sysroot, "var/lib/slackpkg",
+                                         section + "-filelist.gz"), "wb")
+        gzhandl.write("\n".join(filelists[section]) + "\n")
+        gzhandl.close()
+    for idx in range(0, nlibs, 10):
+        os.makedirs(os.path.join(sysroot, "var/lib/sbopkg/SBo/13.0",
+                                 ["libraries", "system", "network"][idx % 3],
+                                 "libsyn%d" % idx))
+    return counters
+
+
+class SyntheticRevDep(pyfind_revdep.FindRevDep):
+    """ FindRevDep who doesn't add the host's generic library directories
+        to those of the synthetic ld.so.conf
+    """
+
+    def get_libdir(self):
+        """ Returns directories contained in the synthetic ld.so.conf """
+
+        return pyfind_revdep.read_ldsoconf(self.ldsoconf)
+
+
+def make_scanner(sysroot, workdir, jobs, usecache):
+    """ Returns a FindRevDep instance pointing at the synthetic tree """
+
+    scanner = SyntheticRevDep()
+    scanner.slackdistro = os.path.join(sysroot, "etc/slackware-version")
+    scanner.pkg_install_dir = os.path.join(sysroot, "var/log/packages")
+    scanner.ldsoconf = os.path.join(sysroot, "etc/ld.so.conf")
+    scanner.ldsocache = os.path.join(sysroot, "etc/ld.so.cache")
+    scanner.logfile = os.path.join(workdir, "pyfind-revdep.log")
+    scanner.dbdir = os.path.join(workdir, "db")
+    slkdir = os.path.join(sysroot, "var/lib/slackpkg")
+    scanner.slack64_list = os.path.join(slkdir, "slackware64-filelist.gz")
+    scanner.slack32_list = os.path.join(slkdir, "slackware-filelist.gz")
+    scanner.patches_list = os.path.join(slkdir, "patches-filelist.gz")
+    scanner.extra_list = os.path.join(slkdir, "extra-filelist.gz")
+    scanner.testing_list = os.path.join(slkdir, "testing-filelist.gz")
+    scanner.sbopkg_dir = os.path.join(sysroot, "var/lib/sbopkg/SBo/13.0")
+    scanner.jobs = jobs
+    scanner.usecache = usecache
+    return scanner
+
+
+class PhaseTimer(object):
+    """ Records wall and CPU time of benchmark phases """
+
+    def __init__(self):
+        self.phases = {}
+        self.current = None
+
+    def begin(self, phase):
+        """ Starts timing 'phase' """
+
+        self.current = (phase, time.time(), time.clock())
+
+    def end(self, **counters):
+        """ Stops timing the current phase, storing 'counters' with it """
+
+        phase, wall, cpu = self.current
+        result = {"wall": time.time() - wall, "cpu": time.clock() - cpu}
+        result.update(counters)
+        self.phases[phase] = result
+        self.current = None
+        print "  %-22s %9.3f s wall %9.3f s cpu  %s" % (phase,
+                    result["wall"], result["cpu"],
+                    " ".join(["%s=%s" % item for item in
+                              sorted(counters.items())]))
+
+
+def scan_all(scanner):
+    """ Checks every binary and library -> list of (file, missing lib) """
+
+    broken = []
+    for filename, list_notfound in scanner.scan_files( \
+                            scanner.iter_bin_files()):
+        broken.extend([(filename, lib) for lib in list_notfound or []])
+    for filename, list_notfound in scanner.scan_files( \
+                            scanner.iter_lib_files()):
+        broken.extend([(filename, lib) for lib in list_notfound or []])
+    scanner.save_scan_state()
+    return broken
+
+
+def run_scale(nfiles, basedir, seed, jobs, lddlimit):
+    """ Generates a tree of 'nfiles' files and times each phase -> dict """
+
+    print "Scale %d files:" % nfiles
+    workdir = os.path.join(basedir, "scale%d" % nfiles)
+    sysroot = os.path.join(workdir, "root")
+    timer = PhaseTimer()
+    timer.begin("generate")
+    counters = make_sysroot(sysroot, nfiles, seed)
+    timer.end(**counters)
+    oldenv = (os.environ.get("PATH"), os.environ.get("LD_LIBRARY_PATH"))
+    os.environ["PATH"] = ":".join([os.path.join(sysroot, singdir) for
+                                   singdir in BINDIRS + [APPDIR + "/bin"]])
+    if "LD_LIBRARY_PATH" in os.environ:
+        del os.environ["LD_LIBRARY_PATH"]
+    try:
+        scanner = make_scanner(sysroot, workdir, jobs, False)
+        timer.begin("discovery")
+        nbin = len(scanner.find_bin_files())
+        nlib = len(scanner.find_lib_files())
+        timer.end(binaries=nbin, libraries=nlib)
+
+        scanner = make_scanner(sysroot, workdir, jobs, False)
+        timer.begin("resolve_native")
+        broken = scan_all(scanner)
+        timer.end(broken=len(broken))
+
+        scanner = make_scanner(sysroot, workdir, jobs, True)
+        timer.begin("resolve_cache_cold")
+        scan_all(scanner)
+        timer.end()
+        scanner = make_scanner(sysroot, workdir, jobs, True)
+        timer.begin("resolve_cache_warm")
+        scan_all(scanner)
+        timer.end()
+
+        lddpath = os.path.join(workdir, "ldd")
+        handl = open(lddpath, "w")
+        handl.write(STANDIN_LDD % {"python": sys.executable,
+                    "moddir": os.path.dirname(pyfind_revdep.__file__),
+                    "ldsoconf": scanner.ldsoconf,
+                    "ldsocache": scanner.ldsocache})
+        handl.close()
+        os.chmod(lddpath, 0755)
+        scanner = make_scanner(sysroot, workdir, jobs, False)
+        scanner.useldd = True
+        scanner.lddexec = lddpath
+        list_files = scanner.find_bin_files()[:lddlimit]
+        timer.begin("resolve_ldd")
+        for waste in scanner.scan_files(list_files):
+            pass
+        timer.end(files=len(list_files))
+
+        scanner = make_scanner(sysroot, workdir, jobs, False)
+        timer.begin("cachepkg")
+        scanner.save_cache_stock_slackfiles()
+        scanner.save_cache_sbofiles()
+        timer.end()
+
+        scanner = make_scanner(sysroot, workdir, jobs, False)
+        timer.begin("predict")
+        packages = set()
+        for filename, lib in broken:
+            packages.update(scanner.get_predicted_pkgname(filename, lib))
+        timer.end(pairs=len(broken), packages=len(packages))
+    finally:
+        for name, value in zip(("PATH", "LD_LIBRARY_PATH"), oldenv):
+            if value is not None:
+                os.environ[name] = value
+    shutil.rmtree(workdir)
+    return {"scale": nfiles, "phases": timer.phases}
+
+
+def compare_results(results, baseline, tolerance):
+    """ Prints phases slower than 'baseline' by more than 'tolerance'
+        -> number of regressions
+    """
+
+    regressions = 0
+    oldscales = dict([(single["scale"], single) for single in
+                      baseline["results"]])
+    for single in results["results"]:
+        oldsingle = oldscales.get(single["scale"])
+        if oldsingle is None:
+            continue
+        for phase, values in sorted(single["phases"].items()):
+            oldvalues = oldsingle["phases"].get(phase)
+            if oldvalues is None or phase == "generate":
+                continue
+            if values["wall"] > oldvalues["wall"] * (1 + tolerance) and \
+               values["wall"] - oldvalues["wall"] > 0.05:
+                regressions += 1
+                print "REGRESSION scale %d %s: %.3f s -> %.3f s" % \
+                      (single["scale"], phase, oldvalues["wall"],
+                       values["wall"])
+    return regressions
+
+
+def usage():
+    """ Prints available options """
+
+    print "Usage:  bench_pyfind_revdep.py [options]\n"
+    print "  -s, --scales N,N..  ->  Number of files of each synthetic " \
+          "tree (default: %s)." % ",".join(map(str, DEFAULT_SCALES))
+    print "  -j, --jobs N        ->  Worker processes used by scans " \
+          "(default: 1)."
+    print "      --seed N        ->  Seed of the generated trees " \
+          "(default: 2009)."
+    print "      --ldd-limit N   ->  Files checked with the ldd stand-in " \
+          "(default: 500)."
+    print "  -o, --output FILE   ->  Write JSON results to FILE " \
+          "(default: bench_results.json)."
+    print "  -b, --baseline FILE ->  Compare with previous JSON results, " \
+          "exit 1 on regressions."
+    print "  -t, --tolerance F   ->  Allowed slow down against baseline " \
+          "(default: 0.25)."
+    print "  -d, --workdir DIR   ->  Directory for synthetic trees " \
+          "(default: a temporary one)."
+
+
+def main(args):
+    """ Main routine """
+
+    try:
+        opts, waste = getopt.getopt(args, "hs:j:o:b:t:d:", ["help",
+                        "scales=", "jobs=", "seed=", "ldd-limit=",
+                        "output=", "baseline=", "tolerance=", "workdir="])
+    except getopt.GetoptError, err:
+        print err
+        usage()
+        return 2
+    scales = DEFAULT_SCALES
+    jobs = 1
+    seed = 2009
+    lddlimit = 500
+    output = "bench_results.json"
+    baselinefile = None
+    tolerance = 0.25
+    workdir = None
+    for optionval, value in opts:
+        if optionval in ("-h", "--help"):
+            usage()
+            return 0
+        elif optionval in ("-s", "--scales"):
+            scales = [int(single) for single in value.split(",")]
+        elif optionval in ("-j", "--jobs"):
+            jobs = int(value)
+        elif optionval == "--seed":
+            seed = int(value)
+        elif optionval == "--ldd-limit":
+            lddlimit = int(value)
+        elif optionval in ("-o", "--output"):
+            output = value
+        elif optionval in ("-b", "--baseline"):
+            baselinefile = value
+        elif optionval in ("-t", "--tolerance"):
+            tolerance = float(value)
+        elif optionval in ("-d", "--workdir"):
+            workdir = value
+    if json is None:
+        print "This benchmark requires Python 2.6 or greater (json module)."
+        return 2
+    basedir = tempfile.mkdtemp(prefix="pyfind-revdep-bench-", dir=workdir)
+    results = {"version": pyfind_revdep.__version__,
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "cpus": pyfind_revdep.get_cpu_count(),
+               "jobs": jobs, "seed": seed, "results": []}
+    try:
+        for nfiles in scales:
+            results["results"].append(run_scale(nfiles, basedir, seed, jobs,
+                                                lddlimit))
+    finally:
+        shutil.rmtree(basedir, ignore_errors=True)
+    handl = open(output, "w")
+    json.dump(results, handl, indent=2, sort_keys=True)
+    handl.close()
+    print "Results written to", output
+    if baselinefile:
+        handl = open(baselinefile, "r")
+        baseline = json.load(handl)
+        handl.close()
+        if compare_results(results, baseline, tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
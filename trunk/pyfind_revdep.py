@@ -26,10 +26,61 @@ import sys
 import subprocess
 import getopt
 import gzip
-import pickle
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import struct
+import glob
+import copy
+import hashlib
+import mmap
+import itertools
+import time
+from collections import deque
+try:
+    import multiprocessing
+    # imported now, they couldn't be once chroot'ed into a root
+    import multiprocessing.pool
+    import multiprocessing.queues
+    import multiprocessing.synchronize
+    import multiprocessing.connection
+    import multiprocessing.forking
+except ImportError:
+    # Python 2.5: scans are done in a single process
+    multiprocessing = None
+try:
+    import json
+except ImportError:
+    # Python 2.5: statistics can only be printed
+    json = None
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    # no watch mode
+    ctypes = None
+import select
+import socket
+import errno
+import signal
 
 __version__ = "0.5.1"
 __bdate__ = "20091021"
+SCANSTATE_VERSION = 4
+PKGINDEX_MAGIC = "PYFRDPKG"
+PKGINDEX_VERSION = 2
+PKGFILES_VERSION = 2
+SCAN_CHUNK = 32
+LDD_BATCH = 64
+LDD_TIMEOUT = 10
+DEPGRAPH_VERSION = 2
+SBOMATCHER_VERSION = 1
+SNAPSHOT_VERSION = 1
+CHECK_RECENT_RECORDS = 10
+WATCH_QUIET = 1.0
+WATCH_MAXDELAY = 10.0
+WATCH_CLIENT_TIMEOUT = 1.0
 #elfmagic = str(0x7f454c46L)      # ELF magic
 
 
@@ -57,10 +108,11 @@ def checkpyvers():
     return True
 
 
-def isbinaryfile(filename):
+def isbinaryfile(filename, fsize=None):
     """ Returns True if 'filename' is a binary (elf) file, else False """
 
-    fsize = os.path.getsize(filename)
+    if fsize is None:
+        fsize = os.path.getsize(filename)
     if fsize < 4:   # it doesn't have an header
         return False
     else:
@@ -117,63 +169,1814 @@ def get_env_ldlib():
     return unique_list_ldlib
 
 
+def read_ldsoconf(filename):
+    """ Returns lines of an ld.so.conf file, following its 'include'
+        directives -> list
+    """
+
+    handl = open(filename, "r")
+    raw_lines = handl.readlines()
+    handl.close()
+    list_lines = []
+    for singline in raw_lines:
+        singline = singline.split("#")[0].strip()
+        if singline.startswith("include"):
+            for pattern in singline.split()[1:]:
+                if not pattern.startswith("/"):
+                    pattern = os.path.join(os.path.dirname(filename), pattern)
+                for incfile in sorted(glob.glob(pattern)):
+                    list_lines.extend(read_ldsoconf(incfile))
+        elif singline:
+            list_lines.append(singline)
+    return list_lines
+
+
+def get_file_identity(filename):
+    """ Returns (device, inode, size, mtime, ctime) of 'filename',
+        following symlinks -> tuple, or None if it does not exist
+    """
+
+    try:
+        statist = os.stat(filename)
+    except OSError:
+        return None
+    return (statist.st_dev, statist.st_ino, statist.st_size,
+            statist.st_mtime, statist.st_ctime)
+
+
+def get_notfound_sodep(list_solibs):
+    """ Returns 'not found' libraries of a get_list_sodep() result
+        -> list
+    """
+
+    list_notfound = []
+    if not list_solibs:
+        # Not a .so file
+        return ""
+    for soname, libpath in list_solibs:
+        if libpath.startswith("not"):
+            # lib "not found"
+            if soname not in list_notfound:
+                # to prevent same .so repetitions
+                list_notfound.append(soname)
+    return list_notfound
+
+
+def get_soname_keys(soname):
+    """ Returns names by which a library called 'soname' may be needed,
+        e.g. libfoo.so.1.2.3 -> libfoo.so.1, libfoo.so.1.2, libfoo.so.1.2.3
+        -> list
+    """
+
+    if ".so." not in soname:
+        return [soname]
+    base, version = soname.split(".so.", 1)
+    parts = version.split(".")
+    return [base + ".so." + ".".join(parts[:aaa]) for aaa in \
+            range(1, len(parts) + 1)]
+
+
+def diff_soname_indexes(oldindex, newindex):
+    """ Returns sonames whose paths differ between soname indexes
+        'oldindex' and 'newindex' (see read_ldsocache) -> set
+    """
+
+    return set([soname for soname in set(oldindex) | set(newindex) if \
+                oldindex.get(soname) != newindex.get(soname)])
+
+
+def select_consumers(candidates, affected):
+    """ Returns files of 'candidates' (tuples of filename, sonames it
+        needs, names by which it may be needed) who need, directly or
+        through other candidates, a library called as one of the names in
+        set 'affected', extending it with their names -> set
+    """
+
+    consumers = set()
+    while candidates:
+        # libraries needing an affected library are affected too
+        pending = []
+        for singfile, needed, names in candidates:
+            for soname in needed:
+                if soname in affected:
+                    consumers.add(singfile)
+                    for name in names:
+                        affected.update(get_soname_keys(name))
+                    break
+            else:
+                pending.append((singfile, needed, names))
+        if len(pending) == len(candidates):
+            break
+        candidates = pending
+    return consumers
+
+
+def get_record_pkgname(pkgrecord):
+    """ Returns package name of a /var/log/packages or
+        /var/log/removed_packages record, e.g. zlib-1.2.3-x86_64-2 or
+        zlib-1.2.3-x86_64-2-upgraded-2009-10-21,12:00:00 -> zlib
+    """
+
+    pkgrecord = re.sub(r"-(upgraded|removed)-[0-9].*$", "", pkgrecord)
+    return pkgrecord.rsplit("-", 3)[0]
+
+
+def split_ldd_output(output, list_files):
+    """ Splits standard output of ldd run on 'list_files' into the output
+        of each file: with more than one file, ldd precedes the output of
+        each one with a "filename:" line -> list of str
+    """
+
+    if len(list_files) == 1:
+        return [output]
+    sections = dict([(singfile, []) for singfile in list_files])
+    current = None
+    for singline in output.splitlines(True):
+        header = singline.rstrip("\n")
+        if not singline.startswith("\t") and header.endswith(":") and \
+           header[:-1] in sections:
+            current = sections[header[:-1]]
+        elif current is not None:
+            current.append(singline)
+    return ["".join(sections[singfile]) for singfile in list_files]
+
+
+def clean_ldd_output(raw_output):
+    """ Returns ldd output of a file in the form parsed by
+        parse_ldd_sofiles() -> str, "" if it has no .so dependencies
+    """
+
+    output = raw_output.replace(" =>", "")
+    output = output.replace("\t","")
+    output = output.replace("  ", " ")
+    if not output:
+    #    raise IOError("Fatal Error: executable 'ldd' cannot be found in "
+    #                  "$PATH.")
+        return ""
+    elif output.find("not a dynamic executable") > -1 or \
+         output.find("statically linked") > -1:
+        # it doesn't have .so library dependencies
+        return ""
+    elif output.find("ldd: warning:") > -1:
+        return ""
+    return output
+
+
+def parse_ldd_sofiles(listdep):
+    """ Returns a list of .so dependency files from the output of
+        clean_ldd_output()
+    """
+
+    if not listdep:
+        # Not a .so file
+        return ""
+    list_sodep = []
+    raw_list_sodep = listdep.split("\n")
+    for aaa in raw_list_sodep:
+        if aaa:
+            strippedstr = (aaa.strip("\t")).strip(" ")
+            stripelem = strippedstr.split(" ")
+            list_sodep.append(stripelem)
+
+    list_solibs = []
+    for bbb in range(0, len(list_sodep)):
+        try:
+            wasted = list_sodep[bbb][1]
+        except IndexError: # index 1 doesn't exist
+            continue
+        if (list_sodep[bbb][1]).startswith("(") or \
+           (list_sodep[bbb][0]).startswith("/"):
+            # e.g. ld-linux-x86-64.so.2, ld-linux.so.2,
+            # linux-vdso.so.1, linux-gate.so.1
+            continue
+        libdep = [list_sodep[bbb][0].strip(), list_sodep[bbb][1].strip()]
+        list_solibs.append(libdep)
+
+    #print "list_sodep --> ", list_solibs
+    return list_solibs
+
+
 def getversion():
     """ Prints program version """
     
     print "pyfind_revdep", "version:", __version__, __bdate__
 
 
-def find_common_files(basedir='.'):
-    """ Finds files who are located in 'basedir' directory -> list """
+def walk_files(basedir='.'):
+    """ Walks 'basedir' in the same order as os.walk, without following
+        symlinked directories. Yields (path, stat, islink) for every entry
+        which is not a directory, stat'ing each entry once (twice for
+        symlinks, whose stat is the target's one). Dangling symlinks are
+        skipped.
+    """
+
+    stack = [basedir]
+    while stack:
+        root = stack.pop()
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+        subdirs = []
+        for fff in names:
+            path = root + '/' + fff
+            try:
+                statist = os.lstat(path)
+                islink = stat.S_ISLNK(statist.st_mode)
+                if islink:
+                    statist = os.stat(path)
+                    if stat.S_ISDIR(statist.st_mode):
+                        # symlinked directory, os.walk doesn't follow it
+                        continue
+                elif stat.S_ISDIR(statist.st_mode):
+                    subdirs.append(path)
+                    continue
+            except OSError:
+                continue
+            yield path, statist, islink
+        subdirs.reverse()
+        stack.extend(subdirs)
+
+
+def find_common_files(basedir='.'):
+    """ Finds files who are located in 'basedir' directory, one at a
+        time -> generator
+    """
+
+    for path, statist, islink in walk_files(basedir):
+        yield path
+
+
+def get_ldd_exec():
+    """ Returns directory and filename of ldd command -> str """
+
+    okok = False
+    pathlist = get_env_path()
+    filepath = ""
+    for cmd in pathlist:
+        filepath = os.path.join(cmd, "ldd")
+        #print cmd, filepath
+        if os.path.exists(filepath):
+            okok = True
+            break
+    if okok:
+        return filepath
+    else:
+        fatal_error("Executable 'ldd' cannot be found in $PATH.")
+
+class PathFilter(object):
+    """ Precompiled matcher for a list of regular expressions (as used by
+        multi_match_fileext) and of substrings (as used by
+        multi_found_dir). Plain '\.ext$' patterns become one endswith()
+        call, all the others one compiled regular expression.
+    """
+
+    simple_ext_re = re.compile(r"^\\\.\w+\$$")
+
+    def __init__(self, list_of_extensions_re, list_of_dir=()):
+        suffixes = []
+        others = []
+        for singext in list_of_extensions_re:
+            if self.simple_ext_re.match(singext):
+                suffixes.append(singext[1:-1])
+            else:
+                others.append("(?:%s)" % singext)
+        others.extend([re.escape(singdir) for singdir in list_of_dir])
+        self.suffixes = tuple(suffixes)
+        self.regex = None
+        if others:
+            self.regex = re.compile("|".join(others))
+
+    def match(self, operstring):
+        """ Returns True if 'operstring' matches any pattern, else False """
+
+        if self.suffixes and operstring.endswith(self.suffixes):
+            return True
+        return self.regex is not None and \
+               self.regex.search(operstring) is not None
+
+
+# compiled PathFilter of each list of patterns given to multi_match_fileext
+compiled_filters = {}
+
+
+def multi_match_fileext(list_of_extensions_re, operstring):
+    """ Returns True if any of extensions present in 'list_of_extensions_re'
+        are matching 'operstring' contents, else False
+    """
+
+    patterns = tuple(list_of_extensions_re)
+    if patterns not in compiled_filters:
+        compiled_filters[patterns] = PathFilter(patterns)
+    return compiled_filters[patterns].match(operstring)
+
+
+def multi_found_dir(list_of_dir, operstring):
+    """ Returns True if any of directories present in 'list_of_dir' are found
+        in 'operstring' contents, else False
+    """
+
+    rtnval = False
+    for singdir in list_of_dir:
+        if operstring.find(singdir) != -1:
+            rtnval = True
+            break
+    return rtnval
+
+
+# file name masks of files who aren't checked
+LIB_MASK = ['\.a$', '\.la$', '\.dll$', '\.tcl$', '\.php$']
+BIN_MASK = ['\.py$', '\.sh$', '.csh$', '\.pl$', '\.pm$', '\.rb$']
+
+# files of slackpkg filelists who aren't stored in the stock package cache:
+# installation, config, doc, data, info, man, src, and linux module files,
+# and files with uninteresting extensions
+PKG_IGNORE_FILTER = PathFilter(["\.png$", "\.dtd$", "\.pc$", \
+                    "\.awk$", "\.pl$", "\.py$", "\.pyo$", "\.pyc$", \
+                    "\.spec$", "\.pm$", "\.docbook", "\.html$", \
+                    "\.gif$", "\.a$", "\.desktop$", "\.php$", \
+                    "\.h$", "\.rules$", "\.svgz$", "\.xml$", \
+                    "\.xul$", "\.properties$", "\.css$", "\.jpg$", \
+                    "\.rdf$", "\.ini$", "\.jar$", "\.wav$", "\.mpg$", \
+                    "\.cfg$", "\.la$", "\.gz$", "\.bz2$", "\.cf$", \
+                    "\.txt$", "\.js$", "\.xpt$", "\.ix$", "\.bs$", \
+                    "\.dat$", "\.rws", "\.alias$", "\.multi$", \
+                    "\.conf$", "\.tcl$", "\.msg$", "\.pod$", "\.png$", \
+                    "\.rtf$", "\.tiff$", "\.xpm$", "\.def$", "\.sh$", \
+                    "\.theme$", "\.htm$", "\.rb$", "\.aff$", \
+                    "\.tmpl$", "\.class$"], \
+                    ["/install/", "/etc/", "/usr/doc/", \
+                    "/usr/share/", "/usr/info/", "/usr/include/", \
+                    "/usr/man/", "/usr/src/", "/var/", \
+                    "/lib/modules/"])
+
+
+# ELF constants used by the native dependency reader
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+ET_EXEC = 2
+ET_DYN = 3
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6ffffffd
+SHT_GNU_VERNEED = 0x6ffffffe
+SHT_GNU_VERSYM = 0x6fffffff
+SHN_UNDEF = 0
+STB_LOCAL = 0
+STB_WEAK = 2
+VER_FLG_BASE = 1
+VERSYM_HIDDEN = 0x8000
+
+
+class ElfInfo(object):
+    """ Dynamic linking information read from an ELF file header, its
+        program headers and its dynamic section.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.elfclass = None
+        self.byteorder = None
+        self.machine = None
+        self.etype = None
+        self.interp = None
+        self.isdynamic = False
+        self.needed = []
+        self.rpath = []
+        self.runpath = []
+        self.soname = None
+        self.bytesread = 0
+
+    def compatible(self, other):
+        """ Returns True if 'other' can be loaded together with this
+            object (same class, byte order and machine), else False
+        """
+
+        return self.elfclass == other.elfclass and \
+               self.byteorder == other.byteorder and \
+               self.machine == other.machine
+
+    def get_abi(self):
+        """ Returns what compatible() compares -> tuple """
+
+        return self.elfclass, self.byteorder, self.machine
+
+
+def vaddr_to_offset(loadsegs, vaddr):
+    """ Converts a virtual address into a file offset using PT_LOAD
+        segments (offset, vaddr, filesz) -> int or None
+    """
+
+    for p_offset, p_vaddr, p_filesz in loadsegs:
+        if p_vaddr <= vaddr < p_vaddr + p_filesz:
+            return vaddr - p_vaddr + p_offset
+    return None
+
+
+def read_cstring(strtab, offset):
+    """ Returns the NUL terminated string starting at 'offset' -> str """
+
+    endpos = strtab.find("\0", offset)
+    if endpos == -1:
+        endpos = len(strtab)
+    return strtab[offset:endpos]
+
+
+def read_elf_info(filename):
+    """ Parses ELF header, program headers and dynamic section of
+        'filename' without running any external program -> ElfInfo,
+        or None if it is not a (well formed) ELF file
+    """
+
+    try:
+        handl = open(filename, 'rb')
+    except (IOError, OSError):
+        return None
+    try:
+        try:
+            return parse_elf_handle(handl, filename)
+        except (struct.error, IOError, OSError, ValueError, IndexError):
+            # truncated or malformed file
+            return None
+    finally:
+        handl.close()
+
+
+def parse_elf_handle(handl, filename):
+    """ Does the real work of read_elf_info() on an opened file -> ElfInfo
+        or None
+    """
+
+    ident = handl.read(16)
+    if len(ident) < 16 or not ident.startswith("\x7fELF"):
+        return None
+    info = ElfInfo(filename)
+    info.bytesread = len(ident)
+    info.elfclass = ord(ident[4])
+    info.byteorder = ord(ident[5])
+    if info.byteorder == ELFDATA2LSB:
+        endian = "<"
+    elif info.byteorder == ELFDATA2MSB:
+        endian = ">"
+    else:
+        return None
+    if info.elfclass == ELFCLASS32:
+        ehdr_fmt, phdr_fmt, dyn_fmt = "HHIIIIIHHHHHH", "IIIIIIII", "iI"
+    elif info.elfclass == ELFCLASS64:
+        ehdr_fmt, phdr_fmt, dyn_fmt = "HHIQQQIHHHHHH", "IIQQQQQQ", "qQ"
+    else:
+        return None
+    ehdr_fmt = endian + ehdr_fmt
+    ehdr = struct.unpack(ehdr_fmt, handl.read(struct.calcsize(ehdr_fmt)))
+    info.bytesread += struct.calcsize(ehdr_fmt)
+    info.etype, info.machine = ehdr[0], ehdr[1]
+    e_phoff, e_phentsize, e_phnum = ehdr[4], ehdr[8], ehdr[9]
+    if info.etype not in (ET_EXEC, ET_DYN) or not e_phoff or not e_phnum:
+        return info
+    phdr_fmt = endian + phdr_fmt
+    phdr_size = struct.calcsize(phdr_fmt)
+    if e_phentsize < phdr_size:
+        return None
+    handl.seek(e_phoff)
+    raw_phdrs = handl.read(e_phentsize * e_phnum)
+    info.bytesread += len(raw_phdrs)
+    loadsegs = []
+    dynamic = interp = None
+    for phindex in range(0, e_phnum):
+        start = phindex * e_phentsize
+        phdr = struct.unpack(phdr_fmt, raw_phdrs[start:start+phdr_size])
+        if info.elfclass == ELFCLASS32:
+            p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[1], \
+                                                  phdr[2], phdr[4]
+        else:
+            p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[2], \
+                                                  phdr[3], phdr[5]
+        if p_type == PT_LOAD:
+            loadsegs.append((p_offset, p_vaddr, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+        elif p_type == PT_INTERP:
+            interp = (p_offset, p_filesz)
+    if interp is not None:
+        handl.seek(interp[0])
+        raw_interp = handl.read(interp[1])
+        info.bytesread += len(raw_interp)
+        info.interp = read_cstring(raw_interp, 0)
+    if dynamic is None:
+        # statically linked
+        return info
+    info.isdynamic = True
+    dyn_fmt = endian + dyn_fmt
+    dyn_size = struct.calcsize(dyn_fmt)
+    handl.seek(dynamic[0])
+    raw_dyn = handl.read(dynamic[1])
+    info.bytesread += len(raw_dyn)
+    entries = []
+    strtab_addr = strsz = None
+    for start in range(0, len(raw_dyn) - dyn_size + 1, dyn_size):
+        d_tag, d_val = struct.unpack(dyn_fmt, raw_dyn[start:start+dyn_size])
+        if d_tag == DT_NULL:
+            break
+        elif d_tag == DT_STRTAB:
+            strtab_addr = d_val
+        elif d_tag == DT_STRSZ:
+            strsz = d_val
+        elif d_tag in (DT_NEEDED, DT_SONAME, DT_RPATH, DT_RUNPATH):
+            entries.append((d_tag, d_val))
+    if strtab_addr is None or strsz is None:
+        return info
+    strtab_off = vaddr_to_offset(loadsegs, strtab_addr)
+    if strtab_off is None:
+        return info
+    handl.seek(strtab_off)
+    strtab = handl.read(strsz)
+    info.bytesread += len(strtab)
+    for d_tag, d_val in entries:
+        value = read_cstring(strtab, d_val)
+        if d_tag == DT_NEEDED:
+            info.needed.append(value)
+        elif d_tag == DT_SONAME:
+            info.soname = value
+        elif d_tag == DT_RPATH:
+            info.rpath.extend([aaa for aaa in value.split(":") if aaa])
+        elif d_tag == DT_RUNPATH:
+            info.runpath.extend([aaa for aaa in value.split(":") if aaa])
+    return info
+
+
+class ElfSymbols(object):
+    """ Symbol versions needed and defined by an ELF file (its
+        .gnu.version_r and .gnu.version_d sections) and, if asked, its
+        undefined and exported dynamic symbols.
+    """
+
+    def __init__(self):
+        # needed file (as in DT_NEEDED) -> set of needed versions
+        self.verneed = {}
+        self.verdef = set()
+        # (symbol, version or None, file or None) of non weak undefined
+        # symbols
+        self.undefined = []
+        # names and (name, version) of exported symbols
+        self.exported = set()
+        self.bytesread = 0
+
+
+def read_elf_symbols(filename, withsymbols=False):
+    """ Parses symbol versioning sections and, if 'withsymbols', the
+        dynamic symbol table of 'filename' -> ElfSymbols, or None if it
+        has no section headers or is malformed
+    """
+
+    try:
+        handl = open(filename, 'rb')
+    except (IOError, OSError):
+        return None
+    try:
+        try:
+            return parse_elf_symbols(handl, withsymbols)
+        except (struct.error, IOError, OSError, ValueError, IndexError):
+            return None
+    finally:
+        handl.close()
+
+
+def parse_elf_symbols(handl, withsymbols):
+    """ Does the real work of read_elf_symbols() on an opened file
+        -> ElfSymbols or None
+    """
+
+    ident = handl.read(16)
+    if len(ident) < 16 or not ident.startswith("\x7fELF"):
+        return None
+    if ord(ident[5]) == ELFDATA2LSB:
+        endian = "<"
+    elif ord(ident[5]) == ELFDATA2MSB:
+        endian = ">"
+    else:
+        return None
+    elfclass = ord(ident[4])
+    if elfclass == ELFCLASS32:
+        ehdr_fmt, shdr_fmt, sym_fmt = "HHIIIIIHHHHHH", "IIIIIIIIII", "IIIBBH"
+    elif elfclass == ELFCLASS64:
+        ehdr_fmt, shdr_fmt, sym_fmt = "HHIQQQIHHHHHH", "IIQQQQIIQQ", "IBBHQQ"
+    else:
+        return None
+    symbols = ElfSymbols()
+    ehdr_fmt = endian + ehdr_fmt
+    ehdr = struct.unpack(ehdr_fmt, handl.read(struct.calcsize(ehdr_fmt)))
+    e_shoff, e_shentsize, e_shnum = ehdr[5], ehdr[10], ehdr[11]
+    shdr_fmt = endian + shdr_fmt
+    shdr_size = struct.calcsize(shdr_fmt)
+    if not e_shoff or not e_shnum or e_shentsize < shdr_size:
+        # e.g. sstrip'ed files
+        return None
+    handl.seek(e_shoff)
+    raw_shdrs = handl.read(e_shentsize * e_shnum)
+    symbols.bytesread = 16 + struct.calcsize(ehdr_fmt) + len(raw_shdrs)
+    # (offset, size, link, info) of the first section of each type
+    sections = []
+    bytype = {}
+    for shindex in range(0, e_shnum):
+        start = shindex * e_shentsize
+        shdr = struct.unpack(shdr_fmt, raw_shdrs[start:start+shdr_size])
+        sections.append((shdr[4], shdr[5], shdr[6], shdr[7]))
+        if shdr[1] not in bytype:
+            bytype[shdr[1]] = shindex
+
+    def read_section(shindex):
+        """ Returns contents of section 'shindex' -> str """
+
+        handl.seek(sections[shindex][0])
+        data = handl.read(sections[shindex][1])
+        symbols.bytesread += len(data)
+        return data
+
+    # version index (as in .gnu.version) -> (version, file)
+    neednames = {}
+    if SHT_GNU_VERNEED in bytype:
+        shindex = bytype[SHT_GNU_VERNEED]
+        data = read_section(shindex)
+        strtab = read_section(sections[shindex][2])
+        pos = 0
+        for waste in range(0, sections[shindex][3]):
+            vn_cnt, vn_file, vn_aux, vn_next = \
+                    struct.unpack(endian + "HHIII", data[pos:pos+16])[1:]
+            needfile = read_cstring(strtab, vn_file)
+            versions = symbols.verneed.setdefault(needfile, set())
+            auxpos = pos + vn_aux
+            for waste in range(0, vn_cnt):
+                vna_other, vna_name, vna_next = \
+                        struct.unpack(endian + "IHHII",
+                                      data[auxpos:auxpos+16])[2:]
+                version = read_cstring(strtab, vna_name)
+                versions.add(version)
+                neednames[vna_other] = (version, needfile)
+                if not vna_next:
+                    break
+                auxpos += vna_next
+            if not vn_next:
+                break
+            pos += vn_next
+    # version index -> version
+    defnames = {}
+    if SHT_GNU_VERDEF in bytype:
+        shindex = bytype[SHT_GNU_VERDEF]
+        data = read_section(shindex)
+        strtab = read_section(sections[shindex][2])
+        pos = 0
+        for waste in range(0, sections[shindex][3]):
+            verdef = struct.unpack(endian + "HHHHIII", data[pos:pos+20])
+            vd_flags, vd_ndx, vd_aux, vd_next = verdef[1], verdef[2], \
+                                                verdef[5], verdef[6]
+            vda_name = struct.unpack(endian + "I",
+                                     data[pos+vd_aux:pos+vd_aux+4])[0]
+            version = read_cstring(strtab, vda_name)
+            defnames[vd_ndx] = version
+            if not vd_flags & VER_FLG_BASE:
+                # the base definition is the soname itself
+                symbols.verdef.add(version)
+            if not vd_next:
+                break
+            pos += vd_next
+    if not withsymbols or SHT_DYNSYM not in bytype:
+        return symbols
+    shindex = bytype[SHT_DYNSYM]
+    data = read_section(shindex)
+    strtab = read_section(sections[shindex][2])
+    versym = ""
+    if SHT_GNU_VERSYM in bytype:
+        versym = read_section(bytype[SHT_GNU_VERSYM])
+    sym_fmt = endian + sym_fmt
+    sym_size = struct.calcsize(sym_fmt)
+    for symindex in range(1, len(data) // sym_size):
+        start = symindex * sym_size
+        sym = struct.unpack(sym_fmt, data[start:start+sym_size])
+        if elfclass == ELFCLASS32:
+            st_name, st_info, st_shndx = sym[0], sym[3], sym[5]
+        else:
+            st_name, st_info, st_shndx = sym[0], sym[1], sym[3]
+        name = read_cstring(strtab, st_name)
+        if not name or st_info >> 4 == STB_LOCAL:
+            continue
+        verindex = 1
+        if len(versym) >= symindex * 2 + 2:
+            verindex = struct.unpack(endian + "H",
+                                     versym[symindex*2:symindex*2+2])[0]
+        if st_shndx == SHN_UNDEF:
+            if st_info >> 4 != STB_WEAK:
+                version, needfile = neednames.get(verindex & ~VERSYM_HIDDEN,
+                                                  (None, None))
+                symbols.undefined.append((name, version, needfile))
+            continue
+        if not verindex & VERSYM_HIDDEN:
+            # default version: found by unversioned references, too
+            symbols.exported.add(name)
+        if verindex & ~VERSYM_HIDDEN in defnames:
+            symbols.exported.add((name, defnames[verindex & ~VERSYM_HIDDEN]))
+    return symbols
+
+
+def expand_origin(searchdirs, filename, elfclass):
+    """ Expands $ORIGIN and $LIB dynamic string tokens in rpath/runpath
+        directories of 'filename' -> list
+    """
+
+    if not searchdirs:
+        return []
+    origin = os.path.dirname(os.path.abspath(filename))
+    if elfclass == ELFCLASS64:
+        libtoken = "lib64"
+    else:
+        libtoken = "lib"
+    expanded = []
+    for singdir in searchdirs:
+        singdir = singdir.replace("${ORIGIN}", origin)
+        singdir = singdir.replace("$ORIGIN", origin)
+        singdir = singdir.replace("${LIB}", libtoken)
+        singdir = singdir.replace("$LIB", libtoken)
+        if singdir not in expanded:
+            expanded.append(singdir)
+    return expanded
+
+
+LDSOCACHE_OLD = "ld.so-1.7.0"
+LDSOCACHE_NEW = "glibc-ld.so.cache1.1"
+
+
+def read_ldsocache(filename):
+    """ Reads the binary cache written by ldconfig (old and new formats)
+        -> dict of soname -> list of paths (in cache order), or None if
+        it does not exist or its format is unknown
+    """
+
+    try:
+        handl = open(filename, "rb")
+        data = handl.read()
+        handl.close()
+    except (IOError, OSError):
+        return None
+    try:
+        if data.startswith(LDSOCACHE_NEW):
+            return parse_ldsocache_new(data, 0)
+        elif data.startswith(LDSOCACHE_OLD):
+            nlibs = struct.unpack("=I", data[12:16])[0]
+            oldend = 16 + nlibs * 12
+            newstart = (oldend + 7) & ~7
+            if data.startswith(LDSOCACHE_NEW, newstart):
+                # new format is appended to the old one: use it
+                return parse_ldsocache_new(data, newstart)
+            sonameindex = {}
+            for entrypos in range(16, oldend, 12):
+                flags, keyoff, valoff = struct.unpack("=iII", \
+                                            data[entrypos:entrypos+12])
+                soname = read_cstring(data, oldend + keyoff)
+                libpath = read_cstring(data, oldend + valoff)
+                sonameindex.setdefault(soname, []).append(libpath)
+            return sonameindex
+    except struct.error:
+        return None
+    return None
+
+
+def parse_ldsocache_new(data, newstart):
+    """ Reads entries of a 'glibc-ld.so.cache1.1' cache starting at
+        'newstart' -> dict of soname -> list of paths
+    """
+
+    nlibs = struct.unpack("=I", data[newstart+20:newstart+24])[0]
+    sonameindex = {}
+    firstentry = newstart + 48
+    for entrypos in range(firstentry, firstentry + nlibs * 24, 24):
+        flags, keyoff, valoff, osversion, hwcap = struct.unpack("=iIIIQ", \
+                                            data[entrypos:entrypos+24])
+        soname = read_cstring(data, newstart + keyoff)
+        libpath = read_cstring(data, newstart + valoff)
+        sonameindex.setdefault(soname, []).append(libpath)
+    return sonameindex
+
+
+def write_stock_index(dictpkgfile, filename):
+    """ Writes a package -> compact_filelist() dict as a sorted index of
+        file basenames, replacing 'filename' atomically. Directories are
+        stored once in the string table.
+    """
+
+    strings = []
+    stroffsets = {}
+    strsize = [0]
+
+    def add_string(value):
+        """ Returns offset of 'value' in the string table """
+        if value not in stroffsets:
+            stroffsets[value] = strsize[0]
+            strings.append(value + "\0")
+            strsize[0] += len(value) + 1
+        return stroffsets[value]
+
+    list_pkgs = sorted(dictpkgfile)
+    entries = []
+    for pkgidx in range(0, len(list_pkgs)):
+        for dirname, basenames in dictpkgfile[list_pkgs[pkgidx]].iteritems():
+            for basename in basenames:
+                entries.append((basename, dirname, pkgidx))
+    entries.sort()
+    pkgtab = [struct.pack("<I", add_string(pkgname)) for pkgname in list_pkgs]
+    entrytab = [struct.pack("<III", add_string(basename), add_string(dirname),
+                            pkgidx) for basename, dirname, pkgidx in entries]
+    headerfmt = "<8s5I"
+    pkgtab_off = struct.calcsize(headerfmt)
+    entries_off = pkgtab_off + 4 * len(pkgtab)
+    strings_off = entries_off + 12 * len(entrytab)
+    header = struct.pack(headerfmt, PKGINDEX_MAGIC, PKGINDEX_VERSION,
+                         len(pkgtab), len(entrytab), entries_off, strings_off)
+    idxfile = open(filename + ".tmp", "wb")
+    idxfile.write(header)
+    idxfile.write("".join(pkgtab))
+    idxfile.write("".join(entrytab))
+    idxfile.write("".join(strings))
+    idxfile.close()
+    os.rename(filename + ".tmp", filename)
+
+
+class StockPackageIndex(object):
+    """ Read-only, memory mapped view of an index written by
+        write_stock_index(): file basenames are sorted, so lookups are
+        binary searches which do not need to load the whole file.
+    """
+
+    def __init__(self, filename):
+        handl = open(filename, "rb")
+        try:
+            self.mapping = mmap.mmap(handl.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        finally:
+            handl.close()
+        headerfmt = "<8s5I"
+        self.pkgtab_off = struct.calcsize(headerfmt)
+        (magic, version, self.npkgs, self.nentries, self.entries_off,
+         self.strings_off) = struct.unpack(headerfmt,
+                                           self.mapping[0:self.pkgtab_off])
+        if magic != PKGINDEX_MAGIC or version != PKGINDEX_VERSION:
+            self.mapping.close()
+            raise ValueError("unknown package index format")
+
+    def get_string(self, offset):
+        """ Returns a string from the string table -> str """
+
+        return read_cstring(self.mapping, self.strings_off + offset)
+
+    def get_entry(self, position):
+        """ Returns (basename, path, package name) of an entry -> tuple """
+
+        entrypos = self.entries_off + position * 12
+        key_off, dir_off, pkgidx = struct.unpack("<III", \
+                                        self.mapping[entrypos:entrypos+12])
+        pkgpos = self.pkgtab_off + pkgidx * 4
+        pkg_off = struct.unpack("<I", self.mapping[pkgpos:pkgpos+4])[0]
+        basename = self.get_string(key_off)
+        return (basename, os.path.join(self.get_string(dir_off), basename),
+                self.get_string(pkg_off))
+
+    def get_key(self, position):
+        """ Returns basename of an entry -> str """
+
+        entrypos = self.entries_off + position * 12
+        key_off = struct.unpack("<I", self.mapping[entrypos:entrypos+4])[0]
+        return self.get_string(key_off)
+
+    def lookup_prefix(self, prefix):
+        """ Returns (path, package name) of files whose basename starts
+            with 'prefix' (e.g. libfoo.so.1 -> libfoo.so.1.2.3) -> list
+        """
+
+        low, high = 0, self.nentries
+        while low < high:
+            middle = (low + high) / 2
+            if self.get_key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        matching = []
+        while low < self.nentries:
+            basename, path, pkgname = self.get_entry(low)
+            if not basename.startswith(prefix):
+                break
+            matching.append((path, pkgname))
+            low += 1
+        return matching
+
+
+def write_dep_graph(dictfiles, filename):
+    """ Writes the dependency graph of checked files (a dict of path ->
+        (identity, list of [soname, path]) as kept in the scan cache),
+        with paths and sonames numbered and real paths of libraries who
+        are symlinks, replacing 'filename' atomically
+    """
+
+    paths = []
+    pathids = {}
+    sonames = []
+    sonameids = {}
+    loaded = {}
+    realpaths = {}
+    for singfile in sorted(dictfiles):
+        if singfile not in pathids:
+            pathids[singfile] = len(paths)
+            paths.append(singfile)
+        edges = []
+        for soname, libpath in dictfiles[singfile][1] or []:
+            if soname not in sonameids:
+                sonameids[soname] = len(sonames)
+                sonames.append(soname)
+            edges.append(sonameids[soname])
+            if not libpath.startswith("/"):
+                # "not found"
+                edges.append(-1)
+                continue
+            if libpath not in pathids:
+                pathids[libpath] = len(paths)
+                paths.append(libpath)
+            if pathids[libpath] not in realpaths:
+                realpaths[pathids[libpath]] = os.path.realpath(libpath)
+            edges.append(pathids[libpath])
+        loaded[pathids[singfile]] = tuple(edges)
+    pckfile = open(filename + ".tmp", "wb")
+    # only the ones who differ are kept
+    realpaths = dict([(libid, realpath) for libid, realpath in \
+                      realpaths.iteritems() if realpath != paths[libid]])
+    pickle.dump({"version": DEPGRAPH_VERSION, "paths": paths,
+                 "sonames": sonames, "loaded": loaded,
+                 "realpaths": realpaths}, pckfile, protocol=2)
+    pckfile.close()
+    os.rename(filename + ".tmp", filename)
+
+
+class DepGraph(object):
+    """ Dependency graph written by write_dep_graph(): for every checked
+        file, the libraries it loads (directly or through other
+        libraries) and the files who provide them. Reverse edges are
+        built the first time they are needed.
+    """
+
+    def __init__(self, filename):
+        pckfile = open(filename, "rb")
+        try:
+            graph = pickle.load(pckfile)
+        finally:
+            pckfile.close()
+        if not isinstance(graph, dict) or \
+           graph.get("version") != DEPGRAPH_VERSION:
+            raise ValueError("unknown dependency graph format")
+        self.paths = graph["paths"]
+        self.sonames = graph["sonames"]
+        self.loaded = graph["loaded"]
+        self.realpaths = graph["realpaths"]
+        self.pathids = None
+        self.sonameids = None
+        self.consumers = None
+        self.providers = None
+
+    def build_reverse_edges(self):
+        """ Builds path -> id, soname -> id, soname -> consumers and
+            soname -> providers indexes
+        """
+
+        self.pathids = dict([(self.paths[aaa], aaa) for aaa in \
+                             range(0, len(self.paths))])
+        self.sonameids = dict([(self.sonames[aaa], aaa) for aaa in \
+                               range(0, len(self.sonames))])
+        self.consumers = {}
+        self.providers = {}
+        for fileid, edges in self.loaded.iteritems():
+            for aaa in range(0, len(edges), 2):
+                sonameid, libid = edges[aaa], edges[aaa + 1]
+                self.consumers.setdefault(sonameid, set()).add(fileid)
+                if libid != -1:
+                    self.providers.setdefault(sonameid, set()).add(libid)
+
+    def get_closure(self, filename):
+        """ Returns libraries loaded by 'filename' as [soname, path] ("not
+            found" if missing) -> list, or None if it is not in the graph
+        """
+
+        if self.pathids is None:
+            self.build_reverse_edges()
+        fileid = self.pathids.get(filename)
+        if fileid is None or fileid not in self.loaded:
+            return None
+        edges = self.loaded[fileid]
+        list_solibs = []
+        for aaa in range(0, len(edges), 2):
+            if edges[aaa + 1] == -1:
+                libpath = "not found"
+            else:
+                libpath = self.paths[edges[aaa + 1]]
+            list_solibs.append([self.sonames[edges[aaa]], libpath])
+        return list_solibs
+
+    def get_providers(self, soname):
+        """ Returns files who provided 'soname' to the checked ones -> list """
+
+        if self.providers is None:
+            self.build_reverse_edges()
+        sonameid = self.sonameids.get(soname)
+        if sonameid is None:
+            return []
+        return [self.paths[aaa] for aaa in self.providers.get(sonameid, ())]
+
+    def get_realpath(self, path):
+        """ Returns 'path' of the graph with symlinks resolved, as they were
+            when the graph was written -> str
+        """
+
+        if self.pathids is None:
+            self.build_reverse_edges()
+        return self.realpaths.get(self.pathids.get(path), path)
+
+    def get_provided_sonames(self, list_paths):
+        """ Returns sonames which files in 'list_paths' were loaded as
+            -> set
+        """
+
+        if self.providers is None:
+            self.build_reverse_edges()
+        libids = set([self.pathids[aaa] for aaa in list_paths if \
+                      aaa in self.pathids])
+        return set([self.sonames[sonameid] for sonameid, providers in \
+                    self.providers.iteritems() if providers & libids])
+
+    def find_consumers(self, list_sonames=(), list_paths=()):
+        """ Returns checked files who load, directly or not, a library
+            called as one of 'list_sonames' or located in one of
+            'list_paths' (compared after resolving symlinks, as they were
+            when the graph was written) -> sorted list
+        """
+
+        if self.consumers is None:
+            self.build_reverse_edges()
+        realpaths = set([os.path.realpath(aaa) for aaa in list_paths])
+        fileids = set()
+        for soname in list_sonames:
+            if soname in self.sonameids:
+                fileids.update(self.consumers.get(self.sonameids[soname], ()))
+        libids = set()
+        for providers in self.providers.itervalues():
+            for libid in providers:
+                if libid not in libids and \
+                   self.realpaths.get(libid, self.paths[libid]) in realpaths:
+                    libids.add(libid)
+        if libids:
+            for fileid, edges in self.loaded.iteritems():
+                for libid in edges[1::2]:
+                    if libid in libids:
+                        fileids.add(fileid)
+                        break
+        return sorted([self.paths[aaa] for aaa in fileids])
+
+
+def write_snapshot(dictfiles, dictlibs, context, filename):
+    """ Writes checked files (a dict of path -> (identity, list of
+        [soname, path]) as kept in the scan cache) and the libraries they
+        load (a dict of path -> identity) as a gzip'ed snapshot, with
+        paths and sonames numbered, replacing 'filename' atomically.
+        Files are identified by size and mtime only, which are the same on
+        copies of a system.
+    """
+
+    paths = []
+    pathids = {}
+    sonames = []
+    sonameids = {}
+
+    def get_pathid(path):
+        """ Returns the number of 'path' """
+        if path not in pathids:
+            pathids[path] = len(paths)
+            paths.append(path)
+        return pathids[path]
+
+    files = {}
+    for singfile in sorted(dictfiles):
+        identity, list_solibs = dictfiles[singfile]
+        edges = []
+        for soname, libpath in list_solibs or []:
+            if soname not in sonameids:
+                sonameids[soname] = len(sonames)
+                sonames.append(soname)
+            edges.append(sonameids[soname])
+            if libpath.startswith("/"):
+                edges.append(get_pathid(libpath))
+            else:
+                # "not found"
+                edges.append(-1)
+        files[get_pathid(singfile)] = (identity[2], identity[3],
+                                       tuple(edges))
+    libs = {}
+    for libpath, identity in dictlibs.iteritems():
+        if identity is not None:
+            libs[get_pathid(libpath)] = (identity[2], identity[3])
+    handl = gzip.open(filename + ".tmp", "wb")
+    pickle.dump({"version": SNAPSHOT_VERSION, "taken": time.time(),
+                 "context": context, "paths": paths, "sonames": sonames,
+                 "files": files, "libs": libs}, handl, protocol=2)
+    handl.close()
+    os.rename(filename + ".tmp", filename)
+
+
+class Snapshot(object):
+    """ Snapshot written by write_snapshot(): .so dependencies of checked
+        files, with their size and mtime and the ones of their libraries.
+    """
+
+    def __init__(self, filename):
+        handl = gzip.open(filename, "rb")
+        try:
+            snapshot = pickle.load(handl)
+        finally:
+            handl.close()
+        if not isinstance(snapshot, dict) or \
+           snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("unknown snapshot format")
+        self.taken = snapshot["taken"]
+        self.context = snapshot["context"]
+        self.paths = snapshot["paths"]
+        self.sonames = snapshot["sonames"]
+        self.files = snapshot["files"]
+        self.libs = snapshot["libs"]
+        self.pathids = None
+
+    def get_pathid(self, path):
+        """ Returns the number of 'path' -> int, or None if unknown """
+
+        if self.pathids is None:
+            self.pathids = dict([(self.paths[pathid], pathid) for pathid \
+                                 in range(0, len(self.paths))])
+        return self.pathids.get(path)
+
+    def get_list_sodep(self, edges):
+        """ Returns the list of [soname, path] of 'edges' -> list """
+
+        list_solibs = []
+        for pos in range(0, len(edges), 2):
+            if edges[pos+1] == -1:
+                libpath = "not found"
+            else:
+                libpath = self.paths[edges[pos+1]]
+            list_solibs.append([self.sonames[edges[pos]], libpath])
+        return list_solibs
+
+    def get_file(self, filename):
+        """ Returns (size, mtime, list of [soname, path]) of a checked
+            file -> tuple, or None if it was not checked
+        """
+
+        entry = self.files.get(self.get_pathid(filename))
+        if entry is None:
+            return None
+        return entry[0], entry[1], self.get_list_sodep(entry[2])
+
+    def has_file(self, filename):
+        """ Returns True if 'filename' was checked, else False """
+
+        return self.get_pathid(filename) in self.files
+
+    def get_lib(self, libpath):
+        """ Returns (size, mtime) of a library -> tuple, or None """
+
+        return self.libs.get(self.get_pathid(libpath))
+
+    def get_broken(self):
+        """ Returns missing sonames of broken files -> dict of path ->
+            list
+        """
+
+        broken = {}
+        for pathid, (size, mtime, edges) in self.files.iteritems():
+            list_notfound = get_notfound_sodep(self.get_list_sodep(edges))
+            if list_notfound:
+                broken[self.paths[pathid]] = list_notfound
+        return broken
+
+
+class SboMatcher(object):
+    """ Aho-Corasick automaton of SlackBuilds.org package names (lower
+        case): finds every name contained in a missing library name in
+        one pass over it. It's built by -c/--cachepkg and saved as plain
+        data (see as_dict), or built again from the package list.
+    """
+
+    def __init__(self, names=None, state=None):
+        if state is not None:
+            if not isinstance(state, dict) or \
+               state.get("version") != SBOMATCHER_VERSION:
+                raise ValueError("unknown SBo matcher format")
+            self.names = state["names"]
+            self.goto = state["goto"]
+            self.fail = state["fail"]
+            self.term = state["term"]
+            self.dictlink = state["dictlink"]
+            return
+        self.names = list(names)
+        # state 0 is the root; term[state] is the index of the name who
+        # ends there (-1: none)
+        self.goto = [{}]
+        self.term = [-1]
+        for nameidx in range(0, len(self.names)):
+            state = 0
+            for char in self.names[nameidx].lower():
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.term.append(-1)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            if self.term[state] == -1:
+                # the first of names differing only in case is kept
+                self.term[state] = nameidx
+        # fail[state]: longest proper suffix who is in the trie;
+        # dictlink[state]: longest proper suffix where a name ends (0: none)
+        self.fail = [0] * len(self.goto)
+        self.dictlink = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nextstate in self.goto[state].iteritems():
+                queue.append(nextstate)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nextstate] = self.goto[fallback].get(char, 0)
+                suffix = self.fail[nextstate]
+                if self.term[suffix] != -1:
+                    self.dictlink[nextstate] = suffix
+                else:
+                    self.dictlink[nextstate] = self.dictlink[suffix]
+
+    def as_dict(self):
+        """ Returns the automaton as plain data, to be pickled -> dict """
+
+        return {"version": SBOMATCHER_VERSION, "names": self.names,
+                "goto": self.goto, "fail": self.fail, "term": self.term,
+                "dictlink": self.dictlink}
+
+    def find_matches(self, text):
+        """ Returns names contained in 'text' (case insensitive), longest
+            first, then in package list order -> list
+        """
+
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            ending = state
+            if self.term[ending] == -1:
+                ending = self.dictlink[ending]
+            while ending:
+                found.add(self.term[ending])
+                ending = self.dictlink[ending]
+        return [self.names[nameidx] for nameidx in \
+                sorted(found, key=lambda idx: (-len(self.names[idx]), idx))]
+
+
+def get_file_digest(filename):
+    """ Returns SHA-1 digest of contents of 'filename' -> str, or None if
+        it cannot be read
+    """
+
+    digest = hashlib.sha1()
+    try:
+        handl = open(filename, "rb")
+    except (IOError, OSError):
+        return None
+    try:
+        while True:
+            block = handl.read(1048576)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        handl.close()
+    return digest.digest()
+
+
+def read_package_record(filename):
+    """ Returns files listed in a /var/log/packages record, with a
+        leading slash and without directories -> list
+    """
+
+    list_files = []
+    handl = open(filename, "r")
+    infilelist = False
+    for filerow in handl:
+        filerow = filerow.rstrip("\n")
+        if not infilelist:
+            if filerow.startswith("FILE LIST:"):
+                infilelist = True
+            continue
+        if not filerow or filerow.endswith("/"):
+            # "./" and directories
+            continue
+        list_files.append("/" + filerow)
+    handl.close()
+    return list_files
+
+
+def compact_filelist(list_files):
+    """ Returns 'list_files' grouped by directory, with directory names
+        interned, so that each one is stored only once in memory and in
+        caches -> dict of directory -> list of basenames
+    """
+
+    filelist = {}
+    for singfile in list_files:
+        dirname, basename = os.path.split(singfile)
+        filelist.setdefault(intern(dirname), []).append(basename)
+    return filelist
+
+
+def get_default_libdirs(elfclass):
+    """ Returns directories searched last by the dynamic loader -> list """
+
+    if elfclass == ELFCLASS64:
+        return ["/lib64", "/usr/lib64", "/lib", "/usr/lib"]
+    else:
+        return ["/lib", "/usr/lib"]
+
+
+def get_cpu_count():
+    """ Returns number of available CPUs, 1 if it cannot be found -> int """
+
+    if multiprocessing is None:
+        return 1
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def get_times():
+    """ Returns wall clock time and CPU (user + system) time used by this
+        process -> tuple of (wall, cpu) seconds
+    """
+
+    cputimes = os.times()
+    return (time.time(), cputimes[0] + cputimes[1])
+
+
+class ScanStats(object):
+    """ Wall clock and CPU time spent in each phase of a run, with the
+        number of times it was entered, and counters of the work done.
+        Phases may be nested. Phases merged from worker processes are
+        summed over all of them, so they may take longer than the run.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.phaseorder = []
+        self.workerphases = set()
+        self.counters = {}
+
+    def start(self):
+        """ Returns a token to be given to stop() -> tuple """
+
+        return get_times()
+
+    def stop(self, phase, started):
+        """ Adds time elapsed since start() returned 'started' to 'phase' """
+
+        wall, cpu = get_times()
+        self.add_time(phase, wall - started[0], cpu - started[1])
+
+    def add_time(self, phase, wall, cpu, calls=1):
+        """ Adds 'wall' and 'cpu' seconds and 'calls' entries to 'phase' """
+
+        if phase not in self.phases:
+            self.phases[phase] = [0.0, 0.0, 0]
+            self.phaseorder.append(phase)
+        times = self.phases[phase]
+        times[0] += wall
+        times[1] += cpu
+        times[2] += calls
+
+    def count(self, counter, value=1):
+        """ Adds 'value' to 'counter' """
+
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def merge(self, other, fromworker=False):
+        """ Adds times and counters of another ScanStats to these ones """
+
+        for phase in other.phaseorder:
+            wall, cpu, calls = other.phases[phase]
+            self.add_time(phase, wall, cpu, calls)
+            if fromworker or phase in other.workerphases:
+                self.workerphases.add(phase)
+        for counter, value in other.counters.items():
+            self.count(counter, value)
+
+    def as_dict(self):
+        """ Returns phases and counters in a JSON serializable form -> dict """
+
+        phases = {}
+        for phase in self.phaseorder:
+            wall, cpu, calls = self.phases[phase]
+            phases[phase] = {"wall": round(wall, 6), "cpu": round(cpu, 6),
+                             "calls": calls,
+                             "workers": phase in self.workerphases}
+        return {"version": __version__, "phases": phases,
+                "counters": dict(self.counters)}
+
+    def print_summary(self):
+        """ Prints a table of phases and counters """
+
+        print "\n\nStatistics of this run:"
+        print "  %-36s %10s %10s %10s" % ("phase", "wall (s)", "cpu (s)",
+                                          "calls")
+        for phase in self.phaseorder:
+            wall, cpu, calls = self.phases[phase]
+            if phase in self.workerphases:
+                phase += " (*)"
+            print "  %-36s %10.3f %10.3f %10d" % (phase, wall, cpu, calls)
+        if self.workerphases:
+            print "  (*) summed over worker processes"
+        print "\n  %-36s %10s" % ("counter", "value")
+        for counter in sorted(self.counters):
+            print "  %-36s %10d" % (counter.replace("_", " "),
+                                    self.counters[counter])
+
+    def write_json(self, filename):
+        """ Writes phases and counters to 'filename' as JSON """
+
+        handl = open(filename, "w")
+        json.dump(self.as_dict(), handl, indent=2, sort_keys=True)
+        handl.write("\n")
+        handl.close()
+
+
+def timed_iter(stats, phase, iterable):
+    """ Yields items of 'iterable', adding time spent producing them to
+        'phase' of 'stats'
+    """
+
+    iterator = iter(iterable)
+    while True:
+        started = stats.start()
+        try:
+            item = iterator.next()
+        except StopIteration:
+            stats.stop(phase, started)
+            return
+        stats.stop(phase, started)
+        yield item
+
+
+def timed_phase(phase):
+    """ Decorator of FindRevDep methods: time spent in them is added to
+        'phase' when statistics are enabled
+    """
+
+    def decorate(method):
+        """ Returns 'method' wrapped """
+
+        def wrapper(self, *args):
+            """ Times a call to 'method' """
+            if self.stats is None:
+                return method(self, *args)
+            started = self.stats.start()
+            try:
+                return method(self, *args)
+            finally:
+                self.stats.stop(phase, started)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorate
+
+
+# FindRevDep instance used by scan worker processes
+worker_scanner = None
+
+
+def init_scan_worker(scanner, root=None):
+    """ Initializes a scan worker process with the parent's scanner,
+        chroot'ing into 'root' if it is given
+    """
+
+    global worker_scanner
+    worker_scanner = scanner
+    if root is not None:
+        os.chroot(root)
+        os.chdir("/")
+        os.environ.pop("LD_LIBRARY_PATH", None)
+
+
+def scan_worker(list_files):
+    """ Resolves a chunk of files inside a worker process -> tuple of
+        (list of lists of .so dependencies, ScanStats of this chunk or
+        None, dict of ELF files read by path, size and mtime)
+    """
+
+    # only what this chunk did is sent back to the parent
+    if worker_scanner.stats is not None:
+        worker_scanner.stats = ScanStats()
+    worker_scanner.newcontentinfo = {}
+    results = worker_scanner.get_list_sodeps(list_files)
+    return results, worker_scanner.stats, worker_scanner.newcontentinfo
+
+
+def filelist_worker(filename, scanner=None):
+    """ Converts a gzipped slackpkg filelist into a dict, possibly inside
+        a worker process -> dict
+    """
+
+    if scanner is None:
+        scanner = worker_scanner
+    gzhandl = gzip.open(filename)
+    dlist = scanner.convert_slackpkg_in_dict(gzhandl)
+    gzhandl.close()
+    return dlist
+
+
+def submit_scan_chunk(get_pool, chunk):
+    """ Sends files of a chunk of scan tasks who need to be resolved to
+        the worker pool returned by 'get_pool()', which is only called if
+        some file needs it -> tuple of (chunk, AsyncResult or None)
+    """
+
+    list_files = [task[0] for task in chunk if task[2] is None and \
+                  not task[3]]
+    if not list_files:
+        return chunk, None
+    return chunk, get_pool().apply_async(scan_worker, (list_files,))
+
+
+def complete_scan_chunk(submitted, scanner):
+    """ Waits for a chunk sent by submit_scan_chunk() and fills in its
+        tasks, merging statistics and ELF files read by path, size and
+        mtime of the worker into 'scanner' -> list
+    """
+
+    chunk, asyncresult = submitted
+    if asyncresult is None:
+        return chunk
+    results, workerstats, workercontent = asyncresult.get()
+    if scanner.stats is not None and workerstats is not None:
+        scanner.stats.merge(workerstats, True)
+    scanner.add_content_info(workercontent)
+    results = iter(results)
+    completed = []
+    for singfile, identity, list_solibs, isalias in chunk:
+        if list_solibs is None and not isalias:
+            list_solibs = results.next()
+        completed.append((singfile, identity, list_solibs, isalias))
+    return completed
+
 
-    matching = []
-    for root, dirs, files in os.walk(basedir):
-        for fff in files:
-            matching.append(root + '/' + fff)
-    return matching
+# inotify(7) constants used by the watch mode
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+             IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
 
 
-def get_ldd_exec():
-    """ Returns directory and filename of ldd command -> str """
+class Inotify(object):
+    """ Minimal inotify(7) interface through ctypes: directories are
+        watched (not recursively) and read_events() returns what changed
+        in them.
+    """
 
-    okok = False
-    pathlist = get_env_path()
-    filepath = ""
-    for cmd in pathlist:
-        filepath = os.path.join(cmd, "ldd")
-        #print cmd, filepath
-        if os.path.exists(filepath):
-            okok = True
-            break
-    if okok:
-        return filepath
-    else:
-        fatal_error("Executable 'ldd' cannot be found in $PATH.")
+    def __init__(self):
+        if ctypes is None:
+            raise OSError("ctypes module is not available")
+        libcname = ctypes.util.find_library("c")
+        if libcname is None:
+            raise OSError("C library cannot be found")
+        self.libc = ctypes.CDLL(libcname)
+        if not hasattr(self.libc, "inotify_init"):
+            raise OSError("inotify is not supported by the C library")
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int,
+                                                ctypes.c_char_p,
+                                                ctypes.c_uint32]
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError("inotify cannot be initialized")
+        self.watches = {}
 
-def multi_match_fileext(list_of_extensions_re, operstring):
-    """ Returns True if any of extensions present in 'list_of_extensions_re'
-        are matching 'operstring' contents, else False
+    def add_watch(self, dirname):
+        """ Watches directory 'dirname' -> True, or False if it cannot be
+            watched (e.g. it doesn't exist or there are too many watches)
+        """
+
+        wdesc = self.libc.inotify_add_watch(self.fd, dirname, WATCH_MASK)
+        if wdesc < 0:
+            return False
+        self.watches[wdesc] = dirname
+        return True
+
+    def read_events(self):
+        """ Reads pending events -> list of (mask, path), where 'path' is
+            the directory itself for events who don't concern an entry
+            of it, and None for IN_Q_OVERFLOW
+        """
+
+        data = os.read(self.fd, 65536)
+        list_events = []
+        pos = 0
+        while pos + 16 <= len(data):
+            wdesc, mask, cookie, namelen = struct.unpack("iIII",
+                                                         data[pos:pos+16])
+            name = data[pos+16:pos+16+namelen].rstrip("\0")
+            pos += 16 + namelen
+            if mask & IN_Q_OVERFLOW:
+                list_events.append((mask, None))
+                continue
+            dirname = self.watches.get(wdesc)
+            if dirname is None:
+                continue
+            if mask & IN_IGNORED:
+                # directory removed (or unmounted)
+                del self.watches[wdesc]
+                continue
+            if name:
+                list_events.append((mask, os.path.join(dirname, name)))
+            else:
+                list_events.append((mask, dirname))
+        return list_events
+
+    def close(self):
+        """ Stops watching """
+
+        os.close(self.fd)
+
+
+class LddRunner(object):
+    """ Runs ldd on batches of files, with at most 'maxprocs' ldd
+        processes at once. A run who takes more than 'timeout' seconds
+        per file is killed: its files are run again one by one, and the
+        ones who still don't answer are given up (their output is None).
     """
 
-    rtnval = False
-    for singext in list_of_extensions_re:
-        if re.search(singext, operstring):
-            rtnval = True
-            break
-    return rtnval
-        
+    def __init__(self, lddexec, maxprocs, timeout):
+        self.lddexec = lddexec
+        self.maxprocs = maxprocs
+        self.timeout = timeout
+        self.queue = deque()
+        self.running = {}
+        self.runs = 0
+        self.killed = 0
+        self.devnull = open(os.devnull, "w")
 
-def multi_found_dir(list_of_dir, operstring):
-    """ Returns True if any of directories present in 'list_of_dir' are found
-        in 'operstring' contents, else False
+    def submit(self, outputs, list_files):
+        """ Queues an ldd run for 'list_files': dict 'outputs' gets the
+            output of each of them, keyed by file name, when it's done
+        """
+
+        self.queue.append((outputs, list_files))
+
+    def is_busy(self):
+        """ Returns whether runs are queued or running -> bool """
+
+        return bool(self.queue or self.running)
+
+    def start_queued(self):
+        """ Starts queued runs, as long as there are free slots """
+
+        while self.queue and len(self.running) < self.maxprocs:
+            outputs, list_files = self.queue.popleft()
+            # in its own process group, so that the dynamic loader run by
+            # the ldd script is killed along with it
+            proc = subprocess.Popen([self.lddexec] + list_files,
+                                    stdout=subprocess.PIPE,
+                                    stderr=self.devnull, close_fds=True,
+                                    preexec_fn=os.setsid)
+            deadline = time.time() + self.timeout * len(list_files)
+            self.running[proc.stdout.fileno()] = (proc, outputs, list_files,
+                                                  [], deadline)
+            self.runs += 1
+
+    def poll(self, wait=None):
+        """ Starts queued runs and waits at most 'wait' seconds (None: as
+            long as needed) for some of them to end or time out
+        """
+
+        self.start_queued()
+        if not self.running:
+            return
+        now = time.time()
+        nextdeadline = min([run[4] for run in self.running.values()])
+        if wait is None or now + wait > nextdeadline:
+            wait = max(nextdeadline - now, 0)
+        try:
+            readable = select.select(self.running.keys(), [], [], wait)[0]
+        except select.error, err:
+            if err.args[0] != errno.EINTR:
+                raise
+            readable = []
+        for fdesc in readable:
+            proc, outputs, list_files, chunks, deadline = self.running[fdesc]
+            data = os.read(fdesc, 65536)
+            if data:
+                chunks.append(data)
+                continue
+            del self.running[fdesc]
+            proc.stdout.close()
+            proc.wait()
+            outputs.update(zip(list_files,
+                               split_ldd_output("".join(chunks), list_files)))
+        now = time.time()
+        for fdesc, (proc, outputs, list_files, chunks, deadline) in \
+                                                self.running.items():
+            if now < deadline:
+                continue
+            del self.running[fdesc]
+            self.kill(proc)
+            if len(list_files) > 1:
+                # find out who is hanging: the others are run again
+                # before anything else
+                self.queue.extendleft([(outputs, [singfile]) for singfile \
+                                       in reversed(list_files)])
+            else:
+                outputs[list_files[0]] = None
+        self.start_queued()
+
+    def kill(self, proc):
+        """ Kills an ldd run, whose output is thrown away """
+
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        proc.stdout.close()
+        proc.wait()
+        self.killed += 1
+
+
+class BrokenFile(object):
+    """ A broken file found by FindRevDep.iter_broken_files(): 'kind' is
+        "binary", "library", "changed" (a file who needs a library given
+        with '--changed') or "file" (found by '--check'), 'missing' lists
+        .so it cannot load (None if ldd timed out on it), 'packages' the
+        packages predicted to be behind it (with prediction on) and 'root'
+        the root it belongs to ("" for this system).
     """
 
-    rtnval = False
-    for singdir in list_of_dir:
-        if operstring.find(singdir) != -1:
-            rtnval = True
-            break
-    return rtnval
+    __slots__ = ("filename", "kind", "missing", "packages", "root")
+
+    def __init__(self, filename, kind, missing, packages=(), root=""):
+        self.filename = filename
+        self.kind = kind
+        self.missing = missing
+        self.packages = list(packages)
+        self.root = root
+
+    def __repr__(self):
+        return "BrokenFile(%r, %r, %r, %r, %r)" % (self.filename, self.kind,
+                                                   self.missing,
+                                                   self.packages, self.root)
+
+
+def find_broken_files(args=(), roots=()):
+    """ Library interface: checks files as 'pyfind_revdep args' would (of
+        this system, or of 'roots'), yielding BrokenFile records instead of
+        printing them. Bad options, options which would print or exit
+        (e.g. '-h', '--status'), and what they ask for being unusable (an
+        unknown '--changed' package, a bad '--baseline', missing package
+        caches) raise ValueError. To reuse loaded indexes between scans,
+        keep a FindRevDep and call its iter_broken_files() instead.
+    """
+
+    scanner = FindRevDep()
+    scanner.apimode = True
+    scanner.getoptions(list(args))
+    return scanner.iter_broken_files(roots=list(roots) or None)
+
+
+def stop_watching(signum, frame):
+    """ SIGTERM handler of the watch mode: exits cleanly """
+
+    sys.exit(0)
 
 
 def run(args):
@@ -181,11 +1984,28 @@ def run(args):
 
     if checkroot():
         if checkpyvers():
+            started = get_times()
             appl = FindRevDep()
             appl.getoptions(args)
-            appl.print_broken_binfiles()
-            appl.print_broken_libfiles()
+            failed = False
+            if appl.dowatch:
+                appl.watch_changes()
+            elif appl.docheck:
+                failed = appl.print_first_broken()
+            elif appl.list_roots:
+                appl.check_roots()
+            else:
+                if appl.list_changed:
+                    appl.print_broken_changedfiles()
+                else:
+                    appl.print_broken_binfiles()
+                    appl.print_broken_libfiles()
+                appl.save_scan_state()
+                appl.save_snapshot()
             appl.print_package_summary()
+            appl.print_stats(started)
+            if failed:
+                sys.exit(1)
 
 
 class FindRevDep(object):
@@ -197,11 +2017,18 @@ class FindRevDep(object):
         self.list_packages = []
         self.slackdistro = "/etc/slackware-version"
         self.pkg_install_dir = "/var/log/packages"
+        self.pkg_removed_dir = "/var/log/removed_packages"
         self.ldsoconf = "/etc/ld.so.conf"
+        self.ldsocache = "/etc/ld.so.cache"
         self.logfile = "/var/log/pyfind-revdep.log"
         self.dbdir = "/var/lib/pyfind-revdep"
-        self.slkdb = "slkdb.pck"
+        self.slkdb = "slkdb.idx"
         self.sbodb = "sbodb.pck"
+        self.sbomatcherdb = "sbomatcher.pck"
+        self.scandb = "scanstate.pck"
+        self.pkgfilesdb = "pkgfiles.pck"
+        self.depgraphdb = "depgraph.pck"
+        self.srcdb = "sources.pck"
         self.dopredict = self.dologreg = False
         self.slack64_list = "/var/lib/slackpkg/slackware64-filelist.gz"
         self.slack32_list = "/var/lib/slackpkg/slackware-filelist.gz"
@@ -209,6 +2036,59 @@ class FindRevDep(object):
         self.extra_list = "/var/lib/slackpkg/extra-filelist.gz"
         self.testing_list = "/var/lib/slackpkg/testing-filelist.gz"
         self.sbopkg_dir = "/var/lib/sbopkg/SBo/13.0"
+        self.sbopkgs = None
+        self.sbomatcher = None
+        self.sbomatches = {}
+        self.stockpkgs = {}
+        self.ownerpkgs = {}
+        self.useldd = False
+        self.lddexec = None
+        self.lddbatch = LDD_BATCH
+        self.lddtimeout = LDD_TIMEOUT
+        self.lddrunner = None
+        self.libdirs = None
+        self.libinfo_cache = {}
+        self.lookup_cache = {}
+        self.depset_cache = {}
+        self.symbols_cache = {}
+        self.checkversions = False
+        self.checkundefined = False
+        self.sonameindex = None
+        self.stockindex = None
+        self.installedindex = None
+        self.direntries = {}
+        self.jobs = get_cpu_count()
+        self.usecache = True
+        self.scanstate = None
+        self.scanlibs = {}
+        self.newscanstate = {}
+        self.newscanlibs = {}
+        self.scanstate_changed = False
+        self.identity_cache = {}
+        self.file_identities = {}
+        self.stats = None
+        self.statsjson = None
+        self.list_changed = []
+        self.depgraph = None
+        self.dowatch = False
+        self.watchsocket = "/var/run/pyfind-revdep.sock"
+        self.statusdb = "status.txt"
+        self.brokenfiles = {}
+        self.watched_ldconf = []
+        self.list_roots = []
+        self.displayroot = ""
+        self.sharecontent = False
+        self.contentinfo = {}
+        self.newcontentinfo = {}
+        self.pool = None
+        self.snapshotfile = None
+        self.baselinefile = None
+        self.baseline = None
+        self.diffsnapshot = None
+        self.docheck = False
+        self.apimode = False
+        self.lastcontext = None
+        self.lastlookups = {}
 
     def usage(self):
         """ Prints program's available options """
@@ -220,9 +2100,64 @@ class FindRevDep(object):
               "behind broken file(s) (Slackware x86 and x86_64 only)."
         print "  -l, --log      ->    Write list of broken files in a log " \
               "as", self.logfile
+        print "      --ldd      ->    Use external 'ldd' command instead of " \
+              "the native ELF reader (slower, for cross-checking)."
+        print "      --ldd-batch N -> Run ldd once for every N files " \
+              "(default: %d)." % LDD_BATCH
+        print "      --ldd-timeout S -> Give up files ldd doesn't answer " \
+              "for in S seconds (default: %d)." % LDD_TIMEOUT
+        print "      --versions ->    Also find symbol versions (e.g. " \
+              "GLIBC_2.34) needed and not defined by the libraries found."
+        print "      --undefined ->   As '--versions', also finding " \
+              "undefined symbols no library loaded exports (like 'ldd -r')."
+        print "  -n, --nocache  ->    Check every file again, without using " \
+              "nor updating the scan cache in", self.dbdir
+        print "  -j, --jobs N   ->    Check files using N worker processes " \
+              "(default: number of CPUs, %d)." % get_cpu_count()
+        print "      --changed X ->   Check only files who need, directly " \
+              "or not, library X (soname or path) or libraries of the " \
+              "installed or removed package X. May be repeated."
+        print "      --root DIR ->    Check files of the system installed " \
+              "in DIR, with its own ld.so.conf, ld.so.cache and packages." \
+              " May be repeated: files with the same contents are read " \
+              "once."
+        print "      --watch    ->    Keep running, checking files again " \
+              "as they (or their libraries) change; what is broken is " \
+              "written in %s and sent to %s clients." % \
+              (os.path.join(self.dbdir, self.statusdb), self.watchsocket)
+        print "      --status   ->    Print what is broken, as known by a " \
+              "running '--watch'."
+        print "      --who-needs X ->  Print files who need library X " \
+              "(soname or path), as found by the last check."
+        print "      --what-breaks X -> Print files who would be broken by " \
+              "removing installed package X, as found by the last check."
+        print "      --closure X ->   Print libraries loaded by file X, as " \
+              "found by the last check."
+        print "      --check    ->    Stop at the first broken file (exit " \
+              "status 1), checking first files who need libraries of " \
+              "packages changed since the last check, then newest files."
+        print "      --snapshot FILE -> Also write .so dependencies of " \
+              "checked files in FILE, for '--diff' and '--baseline'."
+        print "      --diff OLD NEW -> Print files broken and fixed between " \
+              "snapshots OLD and NEW."
+        print "      --baseline FILE -> Take unchanged files (same size and " \
+              "mtime) from snapshot FILE, e.g. made on an identical system."
+        print "      --stats    ->    Print time spent in each phase and " \
+              "counters of the work done."
+        print "      --stats-json FILE -> Also write these statistics to " \
+              "FILE as JSON."
         print "  -h, --help     ->    This help file."
         print "  -V, --version  ->    Print version number."
 
+    def report_error(self, msg):
+        """ Reports an error (in options, or in what they ask for): fatal
+            on the command line, a ValueError through the library interface
+        """
+
+        if self.apimode:
+            raise ValueError(msg)
+        fatal_error(msg)
+
     def option_unknown(self):
         """ Prints usage if an option is not available """
         
@@ -233,12 +2168,29 @@ class FindRevDep(object):
         """ Manages options inserted as command line arguments """
         
         try:
-            opts, args = getopt.getopt(cli_args, "hVplc", \
-                            ["help", "version", "predict", "log", "cachepkg"])
+            opts, args = getopt.getopt(cli_args, "hVplcnj:", \
+                            ["help", "version", "predict", "log", "cachepkg",
+                             "ldd", "jobs=", "nocache", "stats",
+                             "stats-json=", "changed=",
+                             "who-needs=", "what-breaks=", "closure=",
+                             "watch", "status", "root=", "ldd-batch=",
+                             "ldd-timeout=", "snapshot=", "diff=",
+                             "baseline=", "check", "versions",
+                             "undefined"])
         except getopt.GetoptError, err:
+            if self.apimode:
+                raise ValueError(str(err))
             self.option_unknown()
             sys.exit(2)
         for optionval, waste in opts:
+            if self.apimode and optionval in ("-V", "-h", "--help", "-c",
+                                              "--cachepkg", "--status",
+                                              "--who-needs", "--what-breaks",
+                                              "--closure", "--diff",
+                                              "--watch"):
+                # they would print, exit or never return
+                self.report_error("Option '%s' cannot be used through the " \
+                                  "library interface." % optionval)
             if optionval == "-V":
                 getversion()
                 sys.exit(0)
@@ -249,21 +2201,121 @@ class FindRevDep(object):
                 if self.isslackware():
                     self.dopredict = True
                 else:
-                    fatal_error("This is not a Slackware distribution, so" \
-                                " package prediction will not work.")
+                    self.report_error("This is not a Slackware " \
+                                      "distribution, so package prediction " \
+                                      "will not work.")
             elif optionval in ("-l", "--log"):
                 self.dologreg = True
+            elif optionval == "--ldd":
+                self.useldd = True
+            elif optionval == "--versions":
+                self.checkversions = True
+            elif optionval == "--undefined":
+                self.checkversions = self.checkundefined = True
+            elif optionval == "--ldd-batch":
+                try:
+                    self.lddbatch = int(waste)
+                except ValueError:
+                    self.lddbatch = 0
+                if self.lddbatch < 1:
+                    self.report_error("Option '%s' needs a positive " \
+                                      "number of files." % optionval)
+            elif optionval == "--ldd-timeout":
+                try:
+                    self.lddtimeout = float(waste)
+                except ValueError:
+                    self.lddtimeout = 0
+                if self.lddtimeout <= 0:
+                    self.report_error("Option '%s' needs a positive " \
+                                      "number of seconds." % optionval)
+            elif optionval in ("-n", "--nocache"):
+                self.usecache = False
+            elif optionval in ("-j", "--jobs"):
+                try:
+                    self.jobs = int(waste)
+                except ValueError:
+                    self.jobs = 0
+                if self.jobs < 1:
+                    self.report_error("Option '%s' needs a positive " \
+                                      "number of jobs." % optionval)
+            elif optionval == "--changed":
+                self.list_changed.append(waste)
+            elif optionval == "--stats":
+                self.stats = ScanStats()
+            elif optionval == "--stats-json":
+                if json is None:
+                    self.report_error("Option '--stats-json' requires " \
+                                      "Python 2.6 or greater.")
+                self.stats = ScanStats()
+                self.statsjson = waste
+            elif optionval == "--root":
+                if not os.path.isdir(waste):
+                    self.report_error("Root '%s' is not a directory." % waste)
+                self.list_roots.append(os.path.abspath(waste))
+            elif optionval == "--watch":
+                if ctypes is None:
+                    self.report_error("Option '--watch' requires Python " \
+                                      "ctypes module.")
+                self.dowatch = True
+            elif optionval == "--status":
+                self.print_watch_status()
+                sys.exit(0)
+            elif optionval == "--who-needs":
+                self.print_who_needs(waste)
+                sys.exit(0)
+            elif optionval == "--what-breaks":
+                self.print_what_breaks(waste)
+                sys.exit(0)
+            elif optionval == "--closure":
+                self.print_closure(waste)
+                sys.exit(0)
+            elif optionval == "--snapshot":
+                self.snapshotfile = waste
+            elif optionval == "--baseline":
+                if not os.path.exists(waste):
+                    self.report_error("Snapshot '%s' not found." % waste)
+                self.baselinefile = waste
+            elif optionval == "--diff":
+                self.diffsnapshot = waste
+            elif optionval == "--check":
+                self.docheck = True
             elif optionval in ("-c", "--cachepkg"):
                 if self.isslackware():
                     self.save_cache_stock_slackfiles()
                     self.save_cache_sbofiles()
                     sys.exit(0)
                 else:
-                    fatal_error("This is not a Slackware distribution, so" \
-                                " package prediction will not work.")
+                    self.report_error("This is not a Slackware " \
+                                      "distribution, so package prediction " \
+                                      "will not work.")
             else:
                 self.option_unknown()
                 sys.exit(2)
+        if self.diffsnapshot is not None:
+            if len(args) != 1:
+                self.report_error("Option '--diff' needs two snapshot files.")
+            self.print_snapshot_diff(self.diffsnapshot, args[0])
+            sys.exit(0)
+        if self.checkversions and self.useldd:
+            self.report_error("Options '--versions' and '--undefined' " \
+                              "cannot be used with '--ldd' option.")
+        if self.list_roots and (self.useldd or self.dowatch or \
+                                self.list_changed):
+            self.report_error("Option '--root' cannot be used with '--ldd', " \
+                              "'--watch' or '--changed' options.")
+        if (self.snapshotfile or self.baselinefile) and \
+           (self.list_roots or self.dowatch):
+            self.report_error("Options '--snapshot' and '--baseline' " \
+                              "cannot be used with '--root' or '--watch' " \
+                              "options.")
+        if self.docheck and (self.list_roots or self.dowatch or \
+                             self.list_changed or self.snapshotfile):
+            self.report_error("Option '--check' cannot be used with " \
+                              "'--root', '--watch', '--changed' or " \
+                              "'--snapshot' options.")
+        if self.snapshotfile and self.list_changed:
+            self.report_error("Option '--snapshot' cannot be used with " \
+                              "'--changed' option.")
 
     def ok_varlogpackages(self):
         """ Returns True if /var/log/packages exists, else False """
@@ -286,9 +2338,7 @@ class FindRevDep(object):
             LD_LIBRARY_PATH -> list.
         """
 
-        handl = open(self.ldsoconf, "r")
-        raw_list_libdir = handl.readlines()
-        handl.close()
+        raw_list_libdir = read_ldsoconf(self.ldsoconf)
         raw_list_libdir2 = get_env_ldlib()
         raw_list_libdir.extend(raw_list_libdir2)
         # generic libs may be postulated by the system, and not in ld.so.conf
@@ -300,128 +2350,1121 @@ class FindRevDep(object):
         list_libdir = []
         for singlib in raw_list_libdir:
             singlib = singlib.strip()
-            if not singlib.startswith("#"):
+            if singlib and not singlib.startswith("#"):
                 if singlib not in list_libdir:
                     if not os.path.islink(singlib):
                         list_libdir.append(singlib)
         return list_libdir
 
-    def find_nomasked_files(self, forbidpattern, basedir='.'):
-        """ Finds files who do NOT have 'forbidpattern' in their file
-            name starting from 'basedir' -> list
+    def find_nomasked_files(self, forbidpattern, basedir='.'):
+        """ Finds files who do NOT have 'forbidpattern' in their file
+            name starting from 'basedir', one at a time -> generator
+        """
+
+        for singfile in find_common_files(basedir):
+            if multi_match_fileext(forbidpattern, singfile):
+                # found forbidden pattern, ignore
+                continue
+            else:
+                yield singfile
+
+    def iter_elf_files(self, list_dirs, forbidpattern):
+        """ Yields executable ELF files located in 'list_dirs' who do NOT
+            have 'forbidpattern' in their file name, as soon as they are
+            found (see search_elf_files)
+        """
+
+        if self.stats is None:
+            return self.search_elf_files(list_dirs, forbidpattern)
+        return timed_iter(self.stats, "discovery",
+                          self.search_elf_files(list_dirs, forbidpattern))
+
+    def search_elf_files(self, list_dirs, forbidpattern):
+        """ Does the real work of iter_elf_files(). Each inode is checked
+            only once: symlinks and hard links to an already seen file are
+            returned without reading it again. Only inodes who may have
+            other names (links) or are ELF files are remembered, so memory
+            doesn't grow with other files.
+        """
+
+        stats = self.stats
+        checked = {}
+        for singdir in list_dirs:
+            walker = walk_files(singdir)
+            if stats is not None:
+                walker = timed_iter(stats, "discovery: walk", walker)
+            for fname, statist, islink in walker:
+                if stats is not None:
+                    stats.count("files_visited")
+                if multi_match_fileext(forbidpattern, fname):
+                    # found forbidden pattern, ignore
+                    continue
+                inode = (statist.st_dev, statist.st_ino)
+                iself = checked.get(inode)
+                if iself is None:
+                    iself = stat.S_ISREG(statist.st_mode) and \
+                            bool(statist.st_mode & stat.S_IEXEC)
+                    if iself and stats is None:
+                        iself = isbinaryfile(fname, statist.st_size)
+                    elif iself:
+                        started = stats.start()
+                        iself = isbinaryfile(fname, statist.st_size)
+                        stats.stop("discovery: header reads", started)
+                        stats.count("bytes_read", min(4, statist.st_size))
+                    if iself or islink or statist.st_nlink > 1:
+                        checked[inode] = iself
+                if iself:
+                    if stats is not None:
+                        stats.count("elf_candidates")
+                    self.file_identities[fname] = (statist.st_dev,
+                                statist.st_ino, statist.st_size,
+                                statist.st_mtime, statist.st_ctime)
+                    yield fname
+
+    def iter_lib_files(self):
+        """ Yields shared object library files as they are found """
+
+        return self.iter_elf_files(self.get_libdir(), LIB_MASK)
+
+    def iter_bin_files(self):
+        """ Yields binary executable files as they are found """
+
+        return self.iter_elf_files(get_env_path(), BIN_MASK)
+
+    def find_lib_files(self):
+        """ Returns all shared object library files -> list """
+
+        return list(self.iter_lib_files())
+
+    def find_bin_files(self):
+        """ Returns binary executable files -> list """
+
+        return list(self.iter_bin_files())
+
+    def find_package_records(self, pkgname):
+        """ Returns paths of the installed record(s) of package 'pkgname'
+            (name or full record name) and of its most recently removed
+            or upgraded record -> list
+        """
+
+        list_records = []
+        for recorddir in (self.pkg_install_dir, self.pkg_removed_dir):
+            if not os.path.isdir(recorddir):
+                continue
+            matching = []
+            for pkgrecord in os.listdir(recorddir):
+                if pkgrecord == pkgname or \
+                   get_record_pkgname(pkgrecord) == pkgname:
+                    recordpath = os.path.join(recorddir, pkgrecord)
+                    matching.append((os.stat(recordpath).st_mtime,
+                                     recordpath))
+            if recorddir == self.pkg_removed_dir and matching:
+                # older removed records are already dealt with
+                matching = [max(matching)]
+            list_records.extend([recordpath for mtime, recordpath in \
+                                 sorted(matching)])
+        return list_records
+
+    def get_changed_sonames(self, list_changed):
+        """ Returns names by which libraries given as sonames, library
+            paths or package names in 'list_changed' may be needed -> set
+        """
+
+        sonames = set()
+        for changed in list_changed:
+            if "/" in changed:
+                list_libs = [changed]
+            else:
+                list_libs = []
+                for recordpath in self.find_package_records(changed):
+                    list_libs.extend([singfile for singfile in \
+                                read_package_record(recordpath) if \
+                                ".so" in os.path.basename(singfile)])
+                if not list_libs and ".so" in changed:
+                    sonames.update(get_soname_keys(changed))
+                    continue
+                elif not list_libs:
+                    self.report_error("'%s' is neither a shared library " \
+                                      "nor a package with shared " \
+                                      "libraries." % changed)
+            for libpath in list_libs:
+                sonames.update(self.get_lib_names(libpath))
+        return sonames
+
+    def get_lib_names(self, libpath):
+        """ Returns names by which library 'libpath' may be needed -> set """
+
+        sonames = set(get_soname_keys(os.path.basename(libpath)))
+        libinfo = self.read_elf(libpath)
+        if libinfo is not None and libinfo.soname:
+            sonames.update(get_soname_keys(libinfo.soname))
+        return sonames
+
+    def find_recent_records(self, since, limit=None):
+        """ Returns paths of package records (installed, upgraded or
+            removed) changed after time 'since', the 'limit' newest ones
+            if given -> list, newest first
+        """
+
+        list_records = []
+        for recorddir in (self.pkg_install_dir, self.pkg_removed_dir):
+            if not os.path.isdir(recorddir):
+                continue
+            for pkgrecord in os.listdir(recorddir):
+                recordpath = os.path.join(recorddir, pkgrecord)
+                try:
+                    mtime = os.stat(recordpath).st_mtime
+                except OSError:
+                    continue
+                if mtime > since:
+                    list_records.append((mtime, recordpath))
+        list_records.sort(reverse=True)
+        if limit is not None:
+            list_records = list_records[:limit]
+        return [recordpath for mtime, recordpath in list_records]
+
+    def iter_check_order(self):
+        """ Yields binary executables and libraries, the most likely to be
+            broken first: files who needed, when last checked, libraries
+            of packages changed since then (before looking for any other
+            file), then the others, newest first
+        """
+
+        yielded = set()
+        graphfile = os.path.join(self.dbdir, self.depgraphdb)
+        if self.usecache and os.path.exists(graphfile):
+            affected = set()
+            for recordpath in self.find_recent_records( \
+                        os.stat(graphfile).st_mtime, CHECK_RECENT_RECORDS):
+                for singfile in read_package_record(recordpath):
+                    if ".so" in os.path.basename(singfile):
+                        affected.update(self.get_lib_names(singfile))
+            if affected:
+                try:
+                    consumers = DepGraph(graphfile).find_consumers(affected)
+                except (IOError, EOFError, ValueError, KeyError,
+                        pickle.UnpicklingError):
+                    consumers = []
+                for singfile in consumers:
+                    if not self.is_checked_file(singfile):
+                        # removed or masked since the last check
+                        continue
+                    yielded.add(singfile)
+                    yield singfile
+        list_files = []
+        for singfile in itertools.chain(self.iter_bin_files(),
+                                        self.iter_lib_files()):
+            if singfile in yielded:
+                continue
+            yielded.add(singfile)
+            identity = self.file_identities.get(singfile)
+            newest = 0
+            if identity is not None:
+                # packages are installed keeping the mtime they were built
+                # with, the ctime is when it happened
+                newest = max(identity[3], identity[4])
+            list_files.append((-newest, singfile))
+        list_files.sort()
+        for newest, singfile in list_files:
+            yield singfile
+
+    def iter_changed_consumers(self, affected):
+        """ Yields binary executables and libraries who need, directly or
+            through other libraries, a library called as one of the names
+            in 'affected' (a set, see get_changed_sonames, extended with
+            names of the libraries found). They are taken from the
+            dependency graph of the last check if there is one (see
+            iter_graph_consumers), else every file is looked at:
+            dependencies are taken from the scan cache when it is
+            unchanged, else from its dynamic section.
+        """
+
+        if self.usecache and self.scanstate is None:
+            self.load_scan_state()
+        graphfile = os.path.join(self.dbdir, self.depgraphdb)
+        if self.usecache and os.path.exists(graphfile):
+            try:
+                depgraph = DepGraph(graphfile)
+            except (IOError, EOFError, ValueError, KeyError,
+                    pickle.UnpicklingError):
+                depgraph = None
+            if depgraph is not None:
+                for singfile in self.iter_graph_consumers(depgraph,
+                                    os.stat(graphfile).st_mtime, affected):
+                    yield singfile
+                return
+        candidates = []
+        list_files = []
+        seen = set()
+        for singfile in itertools.chain(self.iter_bin_files(),
+                                        self.iter_lib_files()):
+            if singfile in seen:
+                continue
+            seen.add(singfile)
+            list_files.append(singfile)
+            identity = self.file_identities.get(singfile)
+            entry = None
+            if self.scanstate:
+                entry = self.scanstate.get(singfile)
+            names = [os.path.basename(singfile)]
+            if entry is not None and identity is not None and \
+               entry[0] == identity:
+                # all libraries it loaded when it was last checked
+                needed = [soname for soname, libpath in entry[1] or []]
+            else:
+                elfinfo = read_elf_info(singfile)
+                if elfinfo is None:
+                    needed = []
+                else:
+                    needed = elfinfo.needed
+                    if elfinfo.soname:
+                        names.append(elfinfo.soname)
+            candidates.append((singfile, needed, names))
+        consumers = select_consumers(candidates, affected)
+        for singfile in list_files:
+            if singfile in consumers:
+                yield singfile
+            else:
+                # only identities of files who will be checked are kept
+                self.file_identities.pop(singfile, None)
+
+    def iter_graph_consumers(self, depgraph, since, affected):
+        """ Does the work of iter_changed_consumers() with 'depgraph',
+            written at time 'since': files who loaded an affected library
+            when they were last checked, and files of packages installed
+            or upgraded since then who need one, read from their dynamic
+            section
+        """
+
+        candidates = []
+        for recordpath in self.find_recent_records(since):
+            for singfile in read_package_record(recordpath):
+                if not self.is_checked_file(singfile):
+                    continue
+                elfinfo = read_elf_info(singfile)
+                if elfinfo is not None:
+                    names = [os.path.basename(singfile)]
+                    if elfinfo.soname:
+                        names.append(elfinfo.soname)
+                    candidates.append((singfile, elfinfo.needed, names))
+        consumers = set()
+        while True:
+            # new files may need an old consumer, and old files a library
+            # of a new one (missing when they were checked)
+            found = set(depgraph.find_consumers(affected)) - consumers
+            for singfile in found:
+                affected.update(get_soname_keys(os.path.basename(singfile)))
+            affected.update(depgraph.get_provided_sonames(found))
+            found.update(select_consumers([aaa for aaa in candidates if \
+                                           aaa[0] not in consumers],
+                                          affected) - consumers)
+            if not found:
+                break
+            consumers.update(found)
+        for singfile in sorted(consumers):
+            if self.is_checked_file(singfile):
+                yield singfile
+
+    def get_ldd_sofiles(self, filename):
+        """ Returns standard output of ldd 'filename' -> str, or None if
+            ldd timed out
+        """
+
+        return self.get_ldd_batch([filename])[0]
+
+    def get_ldd_batch(self, list_files):
+        """ Returns standard output of ldd for each file of 'list_files',
+            running it once for every self.lddbatch files, self.jobs runs
+            at once -> list of str (None for files ldd timed out on)
+        """
+
+        outputs = {}
+        for start in range(0, len(list_files), self.lddbatch):
+            self.submit_ldd(outputs, list_files[start:start+self.lddbatch])
+        while len(outputs) < len(set(list_files)):
+            self.wait_ldd()
+        list_outputs = []
+        for singfile in list_files:
+            output = outputs[singfile]
+            if output is not None:
+                output = clean_ldd_output(output)
+            list_outputs.append(output)
+        return list_outputs
+
+    def submit_ldd(self, outputs, list_files):
+        """ Queues an ldd run for 'list_files' (see LddRunner.submit) """
+
+        if self.lddrunner is None:
+            if self.lddexec is None:
+                # look for ldd in $PATH only once
+                self.lddexec = get_ldd_exec()
+            self.lddrunner = LddRunner(self.lddexec, self.jobs,
+                                       self.lddtimeout)
+        self.lddrunner.submit(outputs, list_files)
+
+    @timed_phase("resolve: ldd")
+    def wait_ldd(self, wait=None):
+        """ Waits for ldd runs (see LddRunner.poll) """
+
+        if self.lddrunner is not None:
+            self.lddrunner.poll(wait)
+
+    def read_elf(self, filename):
+        """ Returns ElfInfo of 'filename' (see read_elf_info). When roots
+            are checked, a file with the same path, size and mtime as in
+            a root already checked (e.g. in clones of one image, as
+            trusted by '--baseline') is not opened: the ElfInfo read there
+            is copied -> ElfInfo or None
+        """
+
+        if not self.sharecontent:
+            return read_elf_info(filename)
+        identity = get_file_identity(filename)
+        if identity is None:
+            return None
+        # paths are the same in every root, which is chroot'ed into
+        key = (filename,) + identity[2:4]
+        if key not in self.contentinfo:
+            elfinfo = read_elf_info(filename)
+            self.contentinfo[key] = self.newcontentinfo[key] = elfinfo
+            return elfinfo
+        elfinfo = self.contentinfo[key]
+        if elfinfo is not None:
+            if self.stats is not None:
+                self.stats.count("shared_elf_reads")
+            elfinfo = copy.copy(elfinfo)
+            # $ORIGIN is the directory of this copy
+            elfinfo.filename = filename
+            elfinfo.bytesread = 0
+        return elfinfo
+
+    def add_content_info(self, contentinfo):
+        """ Adds ELF files read by path, size and mtime in a worker (or
+            root) process
+        """
+
+        self.contentinfo.update(contentinfo)
+        self.newcontentinfo.update(contentinfo)
+
+    def get_lib_info(self, libpath):
+        """ Returns ElfInfo of a candidate shared library, reading it only
+            once per run -> ElfInfo or None
+        """
+
+        if libpath not in self.libinfo_cache:
+            libinfo = self.read_elf(libpath)
+            if self.stats is not None and libinfo is not None:
+                self.stats.count("bytes_read", libinfo.bytesread)
+            self.libinfo_cache[libpath] = libinfo
+        return self.libinfo_cache[libpath]
+
+    def get_dir_entries(self, dirname):
+        """ Returns names contained in 'dirname', listing it only once
+            per run -> set
+        """
+
+        if dirname not in self.direntries:
+            try:
+                self.direntries[dirname] = set(os.listdir(dirname))
+            except OSError:
+                self.direntries[dirname] = set()
+        return self.direntries[dirname]
+
+    def load_soname_index(self):
+        """ Builds the in-memory soname -> paths index from ld.so.cache or,
+            if it is not usable, from a listing of library directories
+        """
+
+        sonameindex = read_ldsocache(self.ldsocache)
+        if sonameindex is None:
+            sonameindex = {}
+            if self.libdirs is None:
+                self.libdirs = self.get_libdir()
+            for libdir in self.libdirs:
+                for soname in sorted(self.get_dir_entries(libdir)):
+                    sonameindex.setdefault(soname, []).append( \
+                                            os.path.join(libdir, soname))
+        self.sonameindex = sonameindex
+
+    def search_needed_lib(self, soname, searchdirs, requester):
+        """ Returns path and ElfInfo of the first library named 'soname'
+            in 'searchdirs' which can be loaded by 'requester' -> tuple,
+            (None, None) if not found
+        """
+
+        if "/" in soname:
+            # DT_NEEDED containing a path is used as is
+            if not os.path.exists(soname):
+                return None, None
+            candidates = [soname]
+        else:
+            candidates = [os.path.join(singdir, soname) for singdir in \
+                          searchdirs if soname in \
+                          self.get_dir_entries(singdir)]
+        for candidate in candidates:
+            libinfo = self.get_lib_info(candidate)
+            if libinfo is not None and requester.compatible(libinfo):
+                return candidate, libinfo
+        return None, None
+
+    def search_cached_lib(self, soname, requester):
+        """ Returns path and ElfInfo of the library named 'soname' in the
+            soname index which can be loaded by 'requester' -> tuple,
+            (None, None) if not found
+        """
+
+        if self.sonameindex is None:
+            self.load_soname_index()
+        for candidate in self.sonameindex.get(soname, ()):
+            libinfo = self.get_lib_info(candidate)
+            if libinfo is not None and requester.compatible(libinfo):
+                return candidate, libinfo
+        return None, None
+
+    def find_needed_lib(self, soname, searchdirs, requester):
+        """ Returns path and ElfInfo of the library named 'soname' which
+            would be loaded for 'requester' with 'searchdirs' (rpath,
+            LD_LIBRARY_PATH and runpath directories) -> tuple, (None, None)
+            if not found. Lookups are done once per run for each soname,
+            search path and kind of requester.
+        """
+
+        key = (soname, tuple(searchdirs), requester.get_abi())
+        if key in self.lookup_cache:
+            if self.stats is not None:
+                self.stats.count("lookup_hits")
+            return self.lookup_cache[key]
+        # same order as the loader: RPATH, LD_LIBRARY_PATH, RUNPATH,
+        # ld.so.cache, default directories
+        libpath, libinfo = self.search_needed_lib(soname, searchdirs,
+                                                  requester)
+        if libpath is None and "/" not in soname:
+            libpath, libinfo = self.search_cached_lib(soname, requester)
+        if libpath is None:
+            libpath, libinfo = self.search_needed_lib(soname,
+                                get_default_libdirs(requester.elfclass),
+                                requester)
+        self.lookup_cache[key] = libpath, libinfo
+        return libpath, libinfo
+
+    def forget_lib_lookups(self):
+        """ Forgets libraries read and looked up so far (e.g. after they
+            changed, for the watch mode)
+        """
+
+        self.libinfo_cache = {}
+        self.identity_cache = {}
+        self.direntries = {}
+        self.lookup_cache = {}
+        self.depset_cache = {}
+        self.symbols_cache = {}
+
+    def get_lib_symbols(self, libpath):
+        """ Returns ElfSymbols of library 'libpath', read once for all
+            the files loading it -> ElfSymbols or None
+        """
+
+        if libpath not in self.symbols_cache:
+            symbols = read_elf_symbols(libpath, self.checkundefined)
+            if self.stats is not None:
+                self.stats.count("symbol_tables_read")
+                if symbols is not None:
+                    self.stats.count("bytes_read", symbols.bytesread)
+            self.symbols_cache[libpath] = symbols
+        return self.symbols_cache[libpath]
+
+    def check_symbols(self, maininfo, list_solibs):
+        """ Adds symbol versions (and, with '--undefined', symbols)
+            needed by the file of 'maininfo' and not provided by the
+            libraries in 'list_solibs' as missing entries, e.g.
+            ["libc.so.6 (GLIBC_2.34)", "not found"] -> list
+        """
+
+        if not self.checkversions:
+            return list_solibs
+        symbols = read_elf_symbols(maininfo.filename, self.checkundefined)
+        if symbols is None:
+            # no section headers: nothing to check
+            return list_solibs
+        if self.stats is not None:
+            self.stats.count("bytes_read", symbols.bytesread)
+        providers = {}
+        if maininfo.interp:
+            providers[os.path.basename(maininfo.interp)] = maininfo.interp
+        for soname, libpath in list_solibs:
+            if libpath.startswith("/"):
+                providers[soname] = libpath
+        missing = []
+        for needfile in sorted(symbols.verneed):
+            if needfile not in providers:
+                continue
+            libsymbols = self.get_lib_symbols(providers[needfile])
+            if libsymbols is None or not libsymbols.verdef:
+                # the loader only warns about libraries without versions
+                continue
+            for version in sorted(symbols.verneed[needfile] - \
+                                  libsymbols.verdef):
+                missing.append(["%s (%s)" % (needfile, version),
+                                "not found"])
+        if self.stats is not None:
+            self.stats.count("missing_versions", len(missing))
+        if self.checkundefined and not get_notfound_sodep(list_solibs):
+            # (when a library is missing, so are its symbols)
+            scope = [self.get_lib_symbols(libpath) for libpath in \
+                     providers.values()]
+            scope = [aaa for aaa in scope if aaa is not None]
+            for name, version, waste in symbols.undefined:
+                for libsymbols in scope:
+                    if name in libsymbols.exported and \
+                       (version is None or not libsymbols.verdef):
+                        break
+                    if (name, version) in libsymbols.exported:
+                        break
+                else:
+                    if version is not None:
+                        name = "%s@%s" % (name, version)
+                    missing.append(["%s (undefined symbol)" % name,
+                                    "not found"])
+                    if self.stats is not None:
+                        self.stats.count("undefined_symbols")
+        if not missing:
+            return list_solibs
+        return list_solibs + missing
+
+    def get_native_sodep(self, filename):
+        """ Resolves .so dependencies of 'filename' (and of the libraries
+            it needs) as the dynamic loader does, without running ldd
+            -> list of [soname, path] ('path' is "not found" for missing
+            libraries), or "" if it is not a dynamic ELF file
+        """
+
+        maininfo = self.read_elf(filename)
+        if self.stats is not None and maininfo is not None:
+            self.stats.count("bytes_read", maininfo.bytesread)
+        if maininfo is None or not maininfo.isdynamic or \
+           not maininfo.needed:
+            return ""
+        if self.libdirs is None:
+            self.libdirs = self.get_libdir()
+        ldlibpath = get_env_ldlib()
+        if maininfo.runpath:
+            exe_rpath = []
+        else:
+            exe_rpath = expand_origin(maininfo.rpath, filename,
+                                      maininfo.elfclass)
+        # files with the same needs and search path (most of them) load
+        # the same libraries: they are resolved once
+        depset = (maininfo.get_abi(), maininfo.interp,
+                  tuple(maininfo.needed), tuple(exe_rpath),
+                  tuple(expand_origin(maininfo.runpath, filename,
+                                      maininfo.elfclass)))
+        if depset in self.depset_cache:
+            if self.stats is not None:
+                self.stats.count("depset_hits")
+            return self.check_symbols(maininfo, self.depset_cache[depset])
+        loaded = {}
+        if maininfo.interp:
+            # the interpreter is always loaded (ld-linux.so.2 et al.)
+            loaded[os.path.basename(maininfo.interp)] = maininfo.interp
+        list_solibs = []
+        queue = [maininfo]
+        qpos = 0
+        while qpos < len(queue):
+            obj = queue[qpos]
+            qpos += 1
+            searchdirs = []
+            if not obj.runpath:
+                # DT_RPATH is ignored when DT_RUNPATH is present
+                searchdirs.extend(expand_origin(obj.rpath, obj.filename,
+                                                obj.elfclass))
+                searchdirs.extend(exe_rpath)
+            searchdirs.extend(ldlibpath)
+            searchdirs.extend(expand_origin(obj.runpath, obj.filename,
+                                            obj.elfclass))
+            for soname in obj.needed:
+                if soname in loaded:
+                    continue
+                libpath, libinfo = self.find_needed_lib(soname, searchdirs,
+                                                        maininfo)
+                if libpath is None:
+                    loaded[soname] = None
+                    list_solibs.append([soname, "not found"])
+                else:
+                    loaded[soname] = libpath
+                    list_solibs.append([soname, libpath])
+                    queue.append(libinfo)
+        self.depset_cache[depset] = list_solibs
+        return self.check_symbols(maininfo, list_solibs)
+
+    def get_list_sodep(self, filename):
+        """ Returns a list of .so dependency files """
+
+        return self.get_list_sodeps([filename])[0]
+
+    @timed_phase("resolve")
+    def get_list_sodeps(self, list_files):
+        """ Returns lists of .so dependency files of 'list_files'; ldd is
+            run once for every self.lddbatch files -> list (None for files
+            ldd timed out on)
+        """
+
+        if self.stats is not None:
+            self.stats.count("resolutions", len(list_files))
+        if not self.useldd:
+            return [self.get_native_sodep(singfile) for singfile in \
+                    list_files]
+        list_results = []
+        for listdep in self.get_ldd_batch(list_files):
+            if listdep is not None:
+                listdep = parse_ldd_sofiles(listdep)
+            list_results.append(listdep)
+        return list_results
+
+    def get_list_notfound(self, filename):
+        """ Returns 'not found' .so dependency files -> list """
+
+        return get_notfound_sodep(self.get_list_sodep(filename))
+
+    def get_scan_context(self):
+        """ Returns settings which invalidate the whole scan cache when
+            they change -> tuple. ld.so.cache is not one of them, as every
+            ldconfig run rewrites it: see use_scan_state().
+        """
+
+        if self.libdirs is None:
+            self.libdirs = self.get_libdir()
+        return (self.useldd, self.checkversions, self.checkundefined,
+                tuple(self.libdirs), os.environ.get("LD_LIBRARY_PATH", ""),
+                get_file_identity(self.ldsoconf))
+
+    @timed_phase("scan cache: load")
+    def read_scan_state(self):
+        """ Reads the scan cache file -> dict, or None if there is no
+            (readable) cache
+        """
+
+        statefile = os.path.join(self.dbdir, self.scandb)
+        if not os.path.exists(statefile):
+            return None
+        try:
+            pckfile = open(statefile, "rb")
+            state = pickle.load(pckfile)
+            pckfile.close()
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            # unreadable cache, everything will be checked again
+            return None
+        return state
+
+    def use_scan_state(self, state):
+        """ Takes results of the previous scan from 'state' (see
+            read_scan_state) if they were found with the same settings,
+            except the ones who load a library whose soname is found
+            elsewhere (or not anymore) in the soname index
+        """
+
+        self.scanstate = {}
+        if state is None or state.get("version") != SCANSTATE_VERSION or \
+           state.get("context") != self.get_scan_context():
+            return
+        self.scanstate = state["files"]
+        self.scanlibs = state["libs"]
+        if self.sonameindex is None:
+            self.load_soname_index()
+        changed = diff_soname_indexes(state["sonameindex"], self.sonameindex)
+        if not changed:
+            return
+        for singfile, entry in self.scanstate.items():
+            for soname, libpath in entry[1] or []:
+                if soname in changed:
+                    del self.scanstate[singfile]
+                    break
+        if self.stats is not None:
+            self.stats.count("cache_invalidated_sonames", len(changed))
+
+    def load_scan_state(self):
+        """ Loads results of the previous scan from the scan cache """
+
+        self.use_scan_state(self.read_scan_state())
+
+    def save_scan_state(self):
+        """ Atomically writes results of this scan to the scan cache,
+            unless they are the same as the cached ones
+        """
+
+        if not self.usecache:
+            return
+        if not self.scanstate_changed and self.scanstate is not None and \
+           len(self.newscanstate) == len(self.scanstate) and \
+           os.path.exists(os.path.join(self.dbdir, self.depgraphdb)):
+            # every file came unchanged from the cache
+            return
+        if self.sonameindex is None:
+            self.load_soname_index()
+        self.write_scan_state(self.get_scan_context(), self.sonameindex)
+        self.scanstate_changed = False
+
+    def write_scan_state(self, context, sonameindex):
+        """ Atomically writes results of this scan, found with settings
+            'context' (see get_scan_context) and soname index
+            'sonameindex', and their dependency graph
+        """
+
+        if self.stats is not None:
+            started = self.stats.start()
+        if not os.path.exists(self.dbdir):
+            os.makedirs(self.dbdir)
+        state = {"version": SCANSTATE_VERSION,
+                 "context": context,
+                 "sonameindex": sonameindex,
+                 "files": self.newscanstate,
+                 "libs": self.newscanlibs}
+        statefile = os.path.join(self.dbdir, self.scandb)
+        pckfile = open(statefile + ".tmp", "wb")
+        pickle.dump(state, pckfile, protocol=2)
+        pckfile.close()
+        os.rename(statefile + ".tmp", statefile)
+        write_dep_graph(self.newscanstate, os.path.join(self.dbdir,
+                                                        self.depgraphdb))
+        if self.stats is not None:
+            self.stats.stop("scan cache: save", started)
+
+    def get_lib_identity(self, libpath):
+        """ Returns identity of a library, stat'ing it once per run """
+
+        if libpath not in self.identity_cache:
+            self.identity_cache[libpath] = get_file_identity(libpath)
+        return self.identity_cache[libpath]
+
+    def get_cached_sodep(self, filename, identity):
+        """ Returns .so dependencies of 'filename' from the scan cache if
+            neither the file nor the libraries it was resolved to have
+            changed -> list, or None if it has to be checked again
+        """
+
+        entry = self.scanstate.get(filename)
+        if entry is None or identity is None or entry[0] != identity:
+            return None
+        cached_identity, list_solibs = entry
+        for soname, libpath in list_solibs or []:
+            if not libpath.startswith("/"):
+                # missing libraries may have been installed meanwhile
+                return None
+            libidentity = self.get_lib_identity(libpath)
+            if libidentity is None or \
+               libidentity != self.scanlibs.get(libpath):
+                # removed or changed library
+                return None
+        return list_solibs
+
+    def get_portable_context(self):
+        """ Returns settings which must be the same for a snapshot to be
+            used as baseline of this system; unlike get_scan_context(),
+            files are compared by contents -> tuple
+        """
+
+        if self.libdirs is None:
+            self.libdirs = self.get_libdir()
+        return (self.useldd, self.checkversions, self.checkundefined,
+                tuple(self.libdirs), os.environ.get("LD_LIBRARY_PATH", ""),
+                get_file_digest(self.ldsoconf),
+                get_file_digest(self.ldsocache))
+
+    def load_snapshot(self, filename):
+        """ Loads snapshot 'filename' --> Snapshot """
+
+        try:
+            return Snapshot(filename)
+        except (IOError, EOFError, ValueError, KeyError,
+                pickle.UnpicklingError):
+            self.report_error("Snapshot '%s' is not valid." % filename)
+
+    def load_baseline(self):
+        """ Loads the snapshot given with '--baseline', unless it was made
+            with other settings
+        """
+
+        baseline = self.load_snapshot(self.baselinefile)
+        if baseline.context != self.get_portable_context():
+            print "Baseline %s was made with other settings (library " \
+                  "directories, ld.so.conf or ld.so.cache), it is not " \
+                  "used." % self.baselinefile
+            self.baselinefile = None
+            return
+        self.baseline = baseline
+
+    def get_baseline_sodep(self, filename, identity):
+        """ Returns .so dependencies of 'filename' from the baseline if it
+            has the same size and mtime there, and so have the libraries
+            it was resolved to -> list, or None if it has to be checked
+        """
+
+        entry = self.baseline.get_file(filename)
+        if entry is None or identity is None or \
+           (entry[0], entry[1]) != identity[2:4]:
+            return None
+        for soname, libpath in entry[2]:
+            if not libpath.startswith("/"):
+                # missing libraries may be installed here
+                return None
+            libidentity = self.get_lib_identity(libpath)
+            if libidentity is None or \
+               libidentity[2:4] != self.baseline.get_lib(libpath):
+                return None
+        return entry[2]
+
+    def save_snapshot(self):
+        """ Writes results of this scan in the snapshot file given with
+            '--snapshot'
         """
 
-        listmatching = []
-        files = find_common_files(basedir)
-        for singfile in files:
-            if multi_match_fileext(forbidpattern, singfile):
-                # found forbidden pattern, ignore
-                continue
-            else:
-                listmatching.append(singfile)
-        return listmatching
+        if not self.snapshotfile:
+            return
+        write_snapshot(self.newscanstate, self.newscanlibs,
+                       self.get_portable_context(), self.snapshotfile)
 
-    def find_lib_files(self):
-        """ Returns all shared object library files -> list """
+    def print_snapshot_diff(self, oldfile, newfile):
+        """ Prints files broken and fixed between snapshots 'oldfile' and
+            'newfile', without checking any file
+        """
 
-        libraries = []
-        list_libdir = self.get_libdir()
-        for libdir in list_libdir:
-            newlib = self.find_nomasked_files(['\.a$', '\.la$', '\.dll$' \
-                            '\.tcl$', '\.php$'], libdir)
-            for fname in newlib:
-                if os.path.exists(fname):
-                    if isbinaryfile(fname):
-                        if isexecutable(fname):
-                            libraries.append(fname)
-        return libraries
+        oldbroken = self.load_snapshot(oldfile).get_broken()
+        newsnapshot = self.load_snapshot(newfile)
+        newbroken = newsnapshot.get_broken()
+        numbroken = numfixed = numremoved = 0
+        for singfile in sorted(set(oldbroken) | set(newbroken)):
+            oldlistdep = oldbroken.get(singfile, [])
+            newlistdep = newbroken.get(singfile, [])
+            if not newsnapshot.has_file(singfile):
+                # removed, or not checked (e.g. ldd timed out on it)
+                numremoved += 1
+                for singdep in oldlistdep:
+                    print "removed %39s  depends on: %15s" % (singfile,
+                                                              singdep)
+                continue
+            if not oldlistdep:
+                numbroken += 1
+            elif not newlistdep:
+                numfixed += 1
+            for singdep in newlistdep:
+                if singdep not in oldlistdep:
+                    print "broken %40s  depends on: %15s" % (singfile,
+                                                             singdep)
+            for singdep in oldlistdep:
+                if singdep not in newlistdep:
+                    print "fixed  %40s  depends on: %15s" % (singfile,
+                                                             singdep)
+        print "\n%d file(s) newly broken, %d file(s) fixed, %d broken " \
+              "file(s) removed or not checked, %d file(s) broken in %s." \
+              % (numbroken, numfixed, numremoved, len(newbroken), newfile)
 
-    def find_bin_files(self):
-        """ Returns binary executable files -> list """
+    def remember_sodep(self, filename, identity, list_solibs):
+        """ Stores .so dependencies of 'filename' for the next scan """
 
-        binaries = []
-        list_path = get_env_path()
-        for bindir in list_path:
-            newbin = self.find_nomasked_files(['\.py$', '\.sh$', '.csh$',
-                            '\.pl$', '\.pm$', '\.rb$'], bindir)
-            for fname in newbin:
-                if os.path.exists(fname):
-                    if isbinaryfile(fname):
-                        if isexecutable(fname):
-                            binaries.append(fname)
-        return binaries
+        if (not self.usecache and not self.dowatch and \
+            not self.snapshotfile) or identity is None or \
+           list_solibs is None:
+            # a file ldd timed out on is checked again next time
+            return
+        entry = self.scanstate.get(filename)
+        if entry is None or entry != (identity, list_solibs):
+            self.scanstate_changed = True
+            if list_solibs:
+                # interned, so that each path is stored once in the cache
+                list_solibs = [[intern(soname), intern(libpath)] for \
+                               soname, libpath in list_solibs]
+            entry = (identity, list_solibs)
+        for soname, libpath in list_solibs or []:
+            if libpath.startswith("/") and libpath not in self.newscanlibs:
+                self.newscanlibs[libpath] = self.get_lib_identity(libpath)
+        self.newscanstate[filename] = entry
 
-    def get_ldd_sofiles(self, filename):
-        """ Returns standard output of ldd 'filename' -> str """
-        binexec = get_ldd_exec()
-        raw_output = subprocess.Popen(binexec+" "+filename+" 2>/dev/null", \
-                    shell=True, stdout=subprocess.PIPE).communicate()[0]
-        output = raw_output.replace(" =>", "")
-        output = output.replace("\t","")
-        output = output.replace("  ", " ")
-        if not output:
-        #    raise IOError("Fatal Error: executable 'ldd' cannot be found in "
-        #                  "$PATH.")
-            return ""
-        elif output.find("not a dynamic executable") > -1:
-            # it doesn't have .so library dependencies
-            return ""
-        elif output.find("ldd: warning:") > -1:
-            return ""
-        return output
+    def prepare_scan(self, iter_files):
+        """ Yields (filename, identity, cached .so dependencies or None,
+            True if it is a link to an already listed file) for files
+            yielded by 'iter_files'
+        """
 
-    def get_list_sodep(self, filename):
-        """ Returns a list of .so dependency files """
+        stats = self.stats
+        seen = set()
+        for singfile in iter_files:
+            identity = self.file_identities.pop(singfile, None)
+            if identity is None:
+                identity = get_file_identity(singfile)
+            if identity is not None:
+                if identity[:2] in seen:
+                    # symlink or hard link to an already listed file
+                    if stats is not None:
+                        stats.count("link_aliases")
+                    yield singfile, identity, None, True
+                    continue
+                seen.add(identity[:2])
+            list_solibs = None
+            if self.usecache:
+                list_solibs = self.get_cached_sodep(singfile, identity)
+                if stats is not None and list_solibs is None:
+                    stats.count("cache_misses")
+                elif stats is not None:
+                    stats.count("cache_hits")
+            if list_solibs is None and self.baseline is not None:
+                list_solibs = self.get_baseline_sodep(singfile, identity)
+                if stats is not None and list_solibs is not None:
+                    stats.count("baseline_hits")
+            yield singfile, identity, list_solibs, False
 
-        listdep = self.get_ldd_sofiles(filename)
-        if not listdep:
-            # Not a .so file
-            return ""
-        list_sodep = []
-        raw_list_sodep = listdep.split("\n")
-        for aaa in raw_list_sodep:
-            if aaa:
-                strippedstr = (aaa.strip("\t")).strip(" ")
-                stripelem = strippedstr.split(" ")
-                list_sodep.append(stripelem)
+    def scan_files(self, iter_files):
+        """ Checks files yielded by 'iter_files' for missing .so
+            dependencies, as they come. Unchanged files are taken from the
+            scan cache, the others are resolved by self.jobs processes;
+            links to an already checked file reuse its result. Yields
+            (filename, list of missing .so) tuples in the same order as
+            'iter_files'; the list is None for files ldd timed out on.
+        """
 
-        list_solibs = []
-        for bbb in range(0, len(list_sodep)):
-            try:
-                wasted = list_sodep[bbb][1]
-            except IndexError: # index 1 doesn't exist
-                continue
-            if (list_sodep[bbb][1]).startswith("(") or \
-               (list_sodep[bbb][0]).startswith("/"):
-                # e.g. ld-linux-x86-64.so.2, ld-linux.so.2,
-                # linux-vdso.so.1, linux-gate.so.1
+        if self.usecache and self.scanstate is None:
+            self.load_scan_state()
+        elif self.scanstate is None and (self.snapshotfile or self.dowatch):
+            # results are kept for the snapshot (or the watch mode) only
+            self.scanstate = {}
+        if self.baselinefile and self.baseline is None:
+            self.load_baseline()
+        inoderesults = {}
+        for singfile, identity, list_solibs, isalias in \
+                self.resolve_files(self.prepare_scan(iter_files)):
+            if isalias:
+                list_solibs = inoderesults[identity[:2]]
+            elif identity is not None:
+                inoderesults[identity[:2]] = list_solibs
+            self.remember_sodep(singfile, identity, list_solibs)
+            if list_solibs is None:
+                if self.stats is not None:
+                    self.stats.count("timed_out_files")
+                yield singfile, None
                 continue
-            libdep = [list_sodep[bbb][0].strip(), list_sodep[bbb][1].strip()]
-            list_solibs.append(libdep)
+            list_notfound = get_notfound_sodep(list_solibs)
+            if self.stats is not None and list_notfound:
+                self.stats.count("broken_files")
+                self.stats.count("missing_deps", len(list_notfound))
+            yield singfile, list_notfound
 
-        #print "list_sodep --> ", list_solibs
-        return list_solibs
+    def resolve_serially(self, tasks):
+        """ Resolves scan tasks in this process, yielding them completed """
 
-    def get_list_notfound(self, filename):
-        """ Returns 'not found' .so dependency files -> list """
+        for singfile, identity, list_solibs, isalias in tasks:
+            if list_solibs is None and not isalias:
+                list_solibs = self.get_list_sodep(singfile)
+            yield singfile, identity, list_solibs, isalias
 
-        list_notfound = []
-        list_solibs = self.get_list_sodep(filename)
-        if not list_solibs:
-            # Not a .so file
-            return ""
-        for ccc in range(0, len(list_solibs)):
-            if (list_solibs[ccc][1]).startswith("not"):
-                # lib "not found"
-                lackingso = list_solibs[ccc][0]
-                if lackingso not in list_notfound:
-                    # to prevent same .so repetitions
-                    list_notfound.append(lackingso)
-        return list_notfound
+    def resolve_with_ldd(self, tasks):
+        """ Resolves scan tasks with ldd, self.lddbatch files per run and
+            self.jobs runs at once, with a bounded number of batches in
+            flight. Yields the tasks, completed, in the same order they
+            come.
+        """
+
+        inflight = deque()
+        chunk = []
+        list_files = []
+        for task in itertools.chain(tasks, [None]):
+            if task is not None:
+                chunk.append(task)
+                if task[2] is None and not task[3]:
+                    list_files.append(task[0])
+                if len(list_files) < self.lddbatch and \
+                   (list_files or len(chunk) < SCAN_CHUNK) and \
+                   len(chunk) < SCAN_CHUNK * self.lddbatch:
+                    # cached files alone are passed along SCAN_CHUNK at a
+                    # time, otherwise a whole batch is waited for
+                    continue
+            if chunk:
+                outputs = {}
+                if list_files:
+                    if self.stats is not None:
+                        self.stats.count("resolutions", len(list_files))
+                    self.submit_ldd(outputs, list_files)
+                inflight.append((chunk, outputs, len(set(list_files))))
+                list_files = []
+            self.wait_ldd(0)
+            while inflight and (task is None or \
+                                len(inflight) > self.jobs * 4 or \
+                                len(inflight[0][1]) == inflight[0][2]):
+                donechunk, outputs, nfiles = inflight[0]
+                if len(outputs) < nfiles:
+                    self.wait_ldd()
+                    continue
+                inflight.popleft()
+                for singfile, identity, list_solibs, isalias in donechunk:
+                    if list_solibs is None and not isalias:
+                        list_solibs = outputs[singfile]
+                        if list_solibs is not None:
+                            list_solibs = parse_ldd_sofiles( \
+                                            clean_ldd_output(list_solibs))
+                    yield singfile, identity, list_solibs, isalias
+            chunk = []
+
+    def resolve_files(self, tasks):
+        """ Resolves .so dependencies of scan tasks (see prepare_scan) who
+            are neither cached nor links, spreading work in chunks across
+            self.jobs processes with a bounded number of chunks in flight.
+            Yields the tasks, completed, in the same order they come.
+        """
+
+        if self.useldd:
+            # ldd runs in child processes already
+            for result in self.resolve_with_ldd(tasks):
+                yield result
+            return
+        if self.sonameindex is None:
+            # built once here, so that worker processes inherit it
+            self.load_soname_index()
+        if self.jobs < 2 or multiprocessing is None:
+            for result in self.resolve_serially(tasks):
+                yield result
+            return
+        # started when a file first needs resolving; a pool made
+        # beforehand (see scan_root) is kept
+        pools = []
+
+        def get_pool():
+            """ Returns the worker pool, starting it the first time """
+            if not pools:
+                pools.append(self.pool or multiprocessing.Pool(self.jobs,
+                                                init_scan_worker, (self,)))
+            return pools[0]
+
+        inflight = deque()
+        chunk = []
+        try:
+            for task in tasks:
+                chunk.append(task)
+                if len(chunk) < SCAN_CHUNK:
+                    continue
+                inflight.append(submit_scan_chunk(get_pool, chunk))
+                chunk = []
+                while inflight and (len(inflight) > self.jobs * 4 or \
+                                    inflight[0][1] is None or \
+                                    inflight[0][1].ready()):
+                    for result in complete_scan_chunk(inflight.popleft(),
+                                                      self):
+                        yield result
+            if chunk and not pools and self.pool is None:
+                # too few files to be worth starting worker processes
+                inflight.append((self.resolve_serially(chunk), None))
+            elif chunk:
+                inflight.append(submit_scan_chunk(get_pool, chunk))
+            while inflight:
+                for result in complete_scan_chunk(inflight.popleft(),
+                                                  self):
+                    yield result
+            if pools and pools[0] is not self.pool:
+                pools[0].close()
+        finally:
+            if pools and pools[0] is not self.pool:
+                pools[0].terminate()
+                pools[0].join()
 
     def convert_slackpkg_in_dict(self, filehandler):
         """ Converts data from a slackpkg file (slackware, patches, extra,
-            testing)-filelist into a dict
+            testing)-filelist into a dict of package -> compact_filelist()
         """
 
         fileinpkg = {}
@@ -439,110 +3482,140 @@ class FindRevDep(object):
                 if listrowconten[rowelem].endswith("/"):
                     # it's a directory, ignore it
                     continue
-                elif multi_found_dir(["/install/", "/etc/", "/usr/doc/", \
-                            "/usr/share/", "/usr/info/", "/usr/include/", \
-                            "/usr/man/", "/usr/src/", "/var/", \
-                            "/lib/modules/"], listrowconten[rowelem]):
-                    # ignores: installation, config, doc, data, info, 
-                    # man, src, and linux module files
+                elif PKG_IGNORE_FILTER.match(listrowconten[rowelem]):
+                    # ignores installation, config, doc, data, info, man,
+                    # src, linux module files and uninteresting extensions
                     continue
-                elif multi_match_fileext(["\.png$", "\.dtd$", "\.pc$", \
-                            "\.awk$", "\.pl$", "\.py$", "\.pyo$", "\.pyc$", \
-                            "\.spec$", "\.pm$", "\.docbook", "\.html$", \
-                            "\.gif$", "\.a$", "\.desktop$", "\.php$", \
-                            "\.h$", "\.rules$", "\.svgz$", "\.xml$", \
-                            "\.xul$", "\.properties$", "\.css$", "\.jpg$", \
-                            "\.rdf$", "\.ini$", "\.jar$", "\.wav$", "\.mpg$", \
-                            "\.cfg$", "\.la$", "\.gz$", "\.bz2$", "\.cf$", \
-                            "\.txt$", "\.js$", "\.xpt$", "\.ix$", "\.bs$", \
-                            "\.dat$", "\.rws", "\.alias$", "\.multi$", \
-                            "\.conf$", "\.tcl$", "\.msg$", "\.pod$", "\.png$", \
-                            "\.rtf$", "\.tiff$", "\.xpm$", "\.def$", "\.sh$", \
-                            "\.theme$", "\.htm$", "\.rb$", "\.aff$", \
-                            "\.tmpl$", "\.class$"], \
-                            listrowconten[rowelem]):
-                    # ignores some file with uninteresting extension
-                    continue                    
                 else:
                     newlistrow.append(listrowconten[rowelem])
             if not newlistrow:
                 # package containing no un-ignored files
                 continue
 
-            fileinpkg[pkgname] = newlistrow
+            fileinpkg[pkgname] = compact_filelist(newlistrow)
         return fileinpkg
             
         
+    def is_cache_current(self, cachename, signature):
+        """ Returns True if the package cache 'cachename' has been built
+            from sources matching 'signature', else False
+        """
+
+        srcfile = os.path.join(self.dbdir, self.srcdb)
+        if not os.path.exists(os.path.join(self.dbdir, cachename)) or \
+           not os.path.exists(srcfile):
+            return False
+        try:
+            pckfile = open(srcfile, "rb")
+            signatures = pickle.load(pckfile)
+            pckfile.close()
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return False
+        return signatures.get(cachename) == signature
+
+    def save_cache_signature(self, cachename, signature):
+        """ Records sources used to build the package cache 'cachename' """
+
+        srcfile = os.path.join(self.dbdir, self.srcdb)
+        signatures = {}
+        if os.path.exists(srcfile):
+            try:
+                pckfile = open(srcfile, "rb")
+                signatures = pickle.load(pckfile)
+                pckfile.close()
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                signatures = {}
+        signatures[cachename] = signature
+        pckfile = open(srcfile + ".tmp", "wb")
+        pickle.dump(signatures, pckfile, protocol=2)
+        pckfile.close()
+        os.rename(srcfile + ".tmp", srcfile)
+
+    def convert_slackpkg_files(self, list_filelists):
+        """ Converts gzipped slackpkg filelists into dicts, reading them
+            concurrently when more than one job is allowed -> list
+        """
+
+        if self.jobs < 2 or multiprocessing is None:
+            return [filelist_worker(singlist, self) for singlist in \
+                    list_filelists]
+        pool = multiprocessing.Pool(min(self.jobs, len(list_filelists)),
+                                    init_scan_worker, (self,))
+        try:
+            list_dicts = pool.map(filelist_worker, list_filelists)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return list_dicts
+
     def save_cache_stock_slackfiles(self):
-        """ Creates a cache of files available in stock Slackware  """
+        """ Creates a cache of files available in stock Slackware, unless
+            slackpkg filelists have not changed since it was built
+        """
 
         if os.path.exists(self.slack64_list):
-            gzslakhandl = gzip.open(self.slack64_list)
-            dlistslak = self.convert_slackpkg_in_dict(gzslakhandl)
-            gzslakhandl.close()
+            mainlist = self.slack64_list
         elif os.path.exists(self.slack32_list):
-            gzslakhandl = gzip.open(self.slack32_list)
-            dlistslak = self.convert_slackpkg_in_dict(gzslakhandl)
-            gzslakhandl.close()
-        else:
-            fatal_error("Files from slackpkg are not found, you must run "
-                        "'slackpkg update' before using '-c' or '--cachepkg'" \
-                        " option.")
-        if os.path.exists(self.patches_list):
-            gzpatchandl = gzip.open(self.patches_list)
-            dlistpatc = self.convert_slackpkg_in_dict(gzpatchandl)
-            gzpatchandl.close()
-        else:
-            fatal_error("Files from slackpkg are not found, you must run "
-                        "'slackpkg update' before using '-c' or '--cachepkg'" \
-                        " option.")
-        if os.path.exists(self.extra_list):
-            gzextrhandl = gzip.open(self.extra_list)
-            dlistextr = self.convert_slackpkg_in_dict(gzextrhandl)
-            gzextrhandl.close()
-        else:
-            fatal_error("Files from slackpkg are not found, you must run "
-                        "'slackpkg update' before using '-c' or '--cachepkg'" \
-                        " option.")
-        if os.path.exists(self.testing_list):
-            gztesthandl = gzip.open(self.testing_list)
-            dlisttest = self.convert_slackpkg_in_dict(gztesthandl)
-            gztesthandl.close()
+            mainlist = self.slack32_list
         else:
-            fatal_error("Files from slackpkg are not found, you must run "
-                        "'slackpkg update' before using '-c' or '--cachepkg'" \
-                        " option.")
-        dlistslak.update(dlistpatc)      
-        dlistslak.update(dlistextr)
-        dlistslak.update(dlisttest)
+            self.report_error("Files from slackpkg are not found, you " \
+                              "must run 'slackpkg update' before " \
+                              "using '-c' or '--cachepkg' option.")
+        list_filelists = [mainlist, self.patches_list, self.extra_list,
+                          self.testing_list]
+        for singlist in list_filelists:
+            if not os.path.exists(singlist):
+                self.report_error("Files from slackpkg are not found, you " \
+                                  "must run 'slackpkg update' before " \
+                                  "using '-c' or '--cachepkg' option.")
+        signature = (__version__, PKGINDEX_VERSION,
+                     [(singlist, get_file_identity(singlist)) \
+                      for singlist in list_filelists])
+        if self.is_cache_current(self.slkdb, signature):
+            print "Stock package cache is up to date."
+            return
+        dlistslak = {}
+        for dlist in self.convert_slackpkg_files(list_filelists):
+            # patches, extra and testing override main packages
+            dlistslak.update(dlist)
         if not os.path.exists(self.dbdir):
             os.mkdir(self.dbdir)
-        pckfile = open(os.path.join(self.dbdir, self.slkdb), "wb")
-        pickle.dump(dlistslak, pckfile, protocol=2)
-        pckfile.close()
+        write_stock_index(dlistslak, os.path.join(self.dbdir, self.slkdb))
+        self.save_cache_signature(self.slkdb, signature)
 
+    @timed_phase("prediction: stock index")
     def load_stock_pkgs(self):
-        """ Loads stock packages and their files in memory --> list """
+        """ Opens the index of stock packages and their files, once per
+            run --> StockPackageIndex
+        """
 
+        if self.stockindex is not None:
+            return self.stockindex
         if os.path.exists(os.path.join(self.dbdir, self.slkdb)):
-            pckfile = open(os.path.join(self.dbdir, self.slkdb), "rb")
-            dictpkgfil = pickle.load(pckfile)
-            pckfile.close()
-            return dictpkgfil
+            try:
+                self.stockindex = StockPackageIndex(os.path.join(self.dbdir,
+                                                                 self.slkdb))
+            except (ValueError, struct.error, EnvironmentError):
+                self.report_error("Stock package cache file is not valid, " \
+                                  "you need to re-build it using '-c' " \
+                                  "or '--cachepkg' option.")
+            return self.stockindex
         else:
-            fatal_error("Stock package cache file not found, you need to " \
-                        "build it using '-c' or '--cachepkg' option.")        
+            self.report_error("Stock package cache file not found, you " \
+                              "need to build it using '-c' or " \
+                              "'--cachepkg' option.")
 
     def find_stock_package(self, missinglib):
         """ Returns name of stock slackware package whom missinglib belongs
             to --> str
         """
         
-        dictpkgfile = self.load_stock_pkgs()
-        for groupkey in dictpkgfile:
-            for singvalue in dictpkgfile[groupkey]:
-                if singvalue.find(missinglib) != -1:
-                    return groupkey
+        pkgindex = self.load_stock_pkgs()
+        for path, pkgname in pkgindex.lookup_prefix( \
+                                        os.path.basename(missinglib)):
+            if path.find(os.path.dirname(missinglib)) != -1:
+                return pkgname
         return None
 
     def convert_sbopkgdirs_in_list(self):
@@ -564,48 +3637,107 @@ class FindRevDep(object):
                             list_of_sbopackage.append(sbopkf)
             return list_of_sbopackage
         else:
-            fatal_error("Files from sbopkg are not found, you must run " \
-                        "'sbopkg -r' before using '-c' or '--cachepkg' " \
-                        "option.")
+            self.report_error("Files from sbopkg are not found, you must " \
+                              "run 'sbopkg -r' before using '-c' or " \
+                              "'--cachepkg' option.")
 
     def save_cache_sbofiles(self):
         """ Creates a cache of package names available on SlackBuilds.org
             using sbopkg directory layout
         """
 
+        if not os.path.exists(self.sbopkg_dir):
+            # convert_sbopkgdirs_in_list() gives the error message
+            self.convert_sbopkgdirs_in_list()
+        list_sbodirs = [self.sbopkg_dir] + \
+                       [os.path.join(self.sbopkg_dir, categ_dir) for \
+                        categ_dir in sorted(os.listdir(self.sbopkg_dir))]
+        signature = (__version__, SBOMATCHER_VERSION,
+                     [(sbodir, get_file_identity(sbodir)) \
+                      for sbodir in list_sbodirs])
+        if self.is_cache_current(self.sbodb, signature):
+            print "SBo package cache is up to date."
+            return
         if not os.path.exists(self.dbdir):
             os.mkdir(self.dbdir)
         pckfile = open(os.path.join(self.dbdir, self.sbodb), "wb")
         dlistsbopkg = self.convert_sbopkgdirs_in_list()
         pickle.dump(dlistsbopkg, pckfile, protocol=2)
         pckfile.close()
+        matcherfile = os.path.join(self.dbdir, self.sbomatcherdb)
+        pckfile = open(matcherfile + ".tmp", "wb")
+        pickle.dump(SboMatcher(dlistsbopkg).as_dict(), pckfile, protocol=2)
+        pckfile.close()
+        os.rename(matcherfile + ".tmp", matcherfile)
+        self.save_cache_signature(self.sbodb, signature)
 
+    @timed_phase("prediction: sbo cache")
     def load_sbo_pkgs(self):
-        """ Loads SlackBuilds.org packages in memory --> list """
+        """ Loads SlackBuilds.org packages in memory, once per run --> list """
 
+        if self.sbopkgs is not None:
+            return self.sbopkgs
         if os.path.exists(os.path.join(self.dbdir, self.sbodb)):
             pckfile = open(os.path.join(self.dbdir, self.sbodb), "rb")
-            listpkgfil = pickle.load(pckfile)
+            self.sbopkgs = pickle.load(pckfile)
             pckfile.close()
-            return listpkgfil
+            return self.sbopkgs
         else:
-            fatal_error("SBo package cache file not found, you need to " \
-                        "build it using '-c' or '--cachepkg' option.")        
+            self.report_error("SBo package cache file not found, you " \
+                              "need to build it using '-c' or " \
+                              "'--cachepkg' option.")
+
+    @timed_phase("prediction: sbo cache")
+    def load_sbo_matcher(self):
+        """ Loads the matcher of SlackBuilds.org package names saved next
+            to the SBo cache (or builds it, if it's missing or outdated),
+            once per run --> SboMatcher
+        """
+
+        if self.sbomatcher is not None:
+            return self.sbomatcher
+        listpkgfiles = self.load_sbo_pkgs()
+        matcherfile = os.path.join(self.dbdir, self.sbomatcherdb)
+        try:
+            pckfile = open(matcherfile, "rb")
+            try:
+                self.sbomatcher = SboMatcher(state=pickle.load(pckfile))
+            finally:
+                pckfile.close()
+            if self.sbomatcher.names != listpkgfiles:
+                self.sbomatcher = None
+        except (IOError, EOFError, ValueError, KeyError,
+                pickle.UnpicklingError):
+            self.sbomatcher = None
+        if self.sbomatcher is None:
+            self.sbomatcher = SboMatcher(listpkgfiles)
+        return self.sbomatcher
+
+    def find_sbo_packages(self, list_missinglibs):
+        """ Returns names of SlackBuilds.org packages who MAY provide each
+            library of 'list_missinglibs', best (longest) match first
+            --> dict of library -> list
+        """
+
+        matcher = None
+        for missinglib in list_missinglibs:
+            if missinglib in self.sbomatches:
+                continue
+            if matcher is None:
+                matcher = self.load_sbo_matcher()
+            self.sbomatches[missinglib] = matcher.find_matches(missinglib)
+        return dict([(missinglib, self.sbomatches[missinglib]) for \
+                     missinglib in list_missinglibs])
 
     def find_sbo_package(self, missinglib):
         """ Returns name of SlackBuilds.org package whom missinglib MAY
             belong to --> str
         """
 
-        lmissinglib = missinglib.lower()
-        listpkgfiles = self.load_sbo_pkgs()
-        rtnval = None
-        for singpkg in listpkgfiles:
-            lsingpkg = singpkg.lower()
-            if lmissinglib.find(lsingpkg) != -1:
-                rtnval = singpkg
-                break
-        return rtnval
+        matches = self.find_sbo_packages([missinglib])[missinglib]
+        if matches:
+            return matches[0]
+        return None
 
     def find_similar_solib(self, solib):
         """ Returns if an already existing shared object library has a name
@@ -623,48 +3755,140 @@ class FindRevDep(object):
         return False
               
         
-    def find_other_package(self, brokenfile):
-        """ Returns possible package name whose file(s) is/are broken,
-            else 'unknown'
-            FIXME: routine catch only first package (problem if a file
-            is contained in 2 or more packages)
+    def update_installed_records(self):
+        """ Returns files of every /var/log/packages record, re-reading
+            only records added or modified since the last run -> dict of
+            record name -> (mtime, compact_filelist() of its files)
+        """
+
+        dbfile = os.path.join(self.dbdir, self.pkgfilesdb)
+        records = {}
+        if os.path.exists(dbfile):
+            try:
+                pckfile = open(dbfile, "rb")
+                state = pickle.load(pckfile)
+                pckfile.close()
+                if state.get("version") == PKGFILES_VERSION:
+                    records = state["records"]
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                # unreadable cache, all records will be read again
+                records = {}
+        modified = False
+        newrecords = {}
+        for pkgrecord in os.listdir(self.pkg_install_dir):
+            recordpath = os.path.join(self.pkg_install_dir, pkgrecord)
+            try:
+                mtime = os.stat(recordpath).st_mtime
+            except OSError:
+                continue
+            if pkgrecord in records and records[pkgrecord][0] == mtime:
+                newrecords[pkgrecord] = records[pkgrecord]
+            else:
+                newrecords[pkgrecord] = (mtime, compact_filelist( \
+                                         read_package_record(recordpath)))
+                modified = True
+                if self.stats is not None:
+                    self.stats.count("package_records_read")
+        if modified or len(newrecords) != len(records):
+            if not os.path.exists(self.dbdir):
+                os.mkdir(self.dbdir)
+            pckfile = open(dbfile + ".tmp", "wb")
+            pickle.dump({"version": PKGFILES_VERSION, "records": newrecords},
+                        pckfile, protocol=2)
+            pckfile.close()
+            os.rename(dbfile + ".tmp", dbfile)
+        return newrecords
+
+    @timed_phase("prediction: package records")
+    def load_installed_index(self):
+        """ Builds the installed packages inverted index, once per run
+            -> dict of directory -> dict of basename -> list of records
         """
 
-        pkginstall = "unknown"
-        newbrokenfile = brokenfile[1:]      # no leading slash
+        if self.installedindex is not None:
+            return self.installedindex
+        self.installedindex = {}
         if self.ok_varlogpackages():
-            list_installed_pkgs = find_common_files(self.pkg_install_dir)
-            for installed in list_installed_pkgs:
-                handl = open(installed, "r")
-                conten_file = handl.readlines()
-                handl.close()
-                for filerow in conten_file:
-                    valuefnd = filerow.find(newbrokenfile)
-                    if valuefnd > -1:
-                        pkginstall = installed
-                        break
-        return pkginstall
+            records = self.update_installed_records()
+            for pkgrecord in sorted(records):
+                for dirname, basenames in records[pkgrecord][1].iteritems():
+                    dirindex = self.installedindex.setdefault(dirname, {})
+                    for basename in basenames:
+                        dirindex.setdefault(basename, []).append(pkgrecord)
+        return self.installedindex
+
+    def get_installed_owners(self, filename):
+        """ Returns installed package records listing 'filename' -> list """
+
+        dirname, basename = os.path.split(filename)
+        return self.load_installed_index().get(dirname, {}).get(basename, [])
+
+    def find_other_package(self, brokenfile):
+        """ Returns names of installed packages whose file(s) is/are
+            broken -> list (empty if no package owns it)
+        """
+
+        owners = list(self.get_installed_owners(brokenfile))
+        realfile = os.path.realpath(brokenfile)
+        if realfile != brokenfile:
+            # symlinks are made by doinst.sh, they aren't in file lists
+            for pkgrecord in self.get_installed_owners(realfile):
+                if pkgrecord not in owners:
+                    owners.append(pkgrecord)
+        return owners
 
     def get_predicted_pkgname(self, brokenfile, brokendep):
-        """ Returns basename of package who has to be rebuilt or
-            installed.
+        """ Returns basenames of packages who have to be rebuilt or
+            installed -> list
         """
-        
-        slkpackagename1 = self.find_stock_package(brokenfile)
-        if slkpackagename1 is not None:
-            # if it's a stock slackware package
-            slkpackagename2 = self.find_stock_package(brokendep)
-            if slkpackagename2 is not None:
-                return os.path.basename(slkpackagename2)
+
+        return self.predict_pkgnames([(brokenfile, brokendep)]) \
+                                    [(brokenfile, brokendep)]
+
+    @timed_phase("prediction")
+    def predict_pkgnames(self, pairs):
+        """ Predicts packages behind (broken file, missing library)
+            'pairs', looking up each file and each library only once per
+            run (per root for package owners), and matching libraries
+            against SBo packages in one pass
+            -> dict of pair -> list of package basenames
+        """
+
+        def find_stock(filename):
+            """ Memoized find_stock_package() """
+            if filename not in self.stockpkgs:
+                self.stockpkgs[filename] = self.find_stock_package(filename)
+            return self.stockpkgs[filename]
+
+        sbopkgs = None
+        predicted = {}
+        for brokenfile, brokendep in pairs:
+            if (brokenfile, brokendep) in predicted:
+                continue
+            if find_stock(brokenfile) is not None:
+                # if it's a stock slackware package
+                if find_stock(brokendep) is not None:
+                    # package is missing dependency lib
+                    predicted[brokenfile, brokendep] = \
+                                    [os.path.basename(find_stock(brokendep))]
+                    continue
+            if sbopkgs is None:
+                sbopkgs = self.find_sbo_packages(sorted(set( \
+                                    [singdep for singfile, singdep in pairs])))
+            if sbopkgs[brokendep]:
                 # package is missing dependency lib
-        sbopackagename1 = self.find_sbo_package(brokendep)
-        if sbopackagename1 is not None:
-            return os.path.basename(sbopackagename1)
-            # package is missing dependency lib
-        othpackagename = self.find_other_package(brokenfile)
-        if othpackagename is not None:
-            return os.path.basename(othpackagename)
-            # package is broken dependency bin/lib
+                predicted[brokenfile, brokendep] = \
+                                    [os.path.basename(sbopkgs[brokendep][0])]
+                continue
+            if brokenfile not in self.ownerpkgs:
+                self.ownerpkgs[brokenfile] = \
+                                    self.find_other_package(brokenfile)
+            if self.ownerpkgs[brokenfile]:
+                # package is broken dependency bin/lib
+                predicted[brokenfile, brokendep] = self.ownerpkgs[brokenfile]
+            else:
+                predicted[brokenfile, brokendep] = ["unknown"]
+        return predicted
 
     def reset_log(self):
         """ Erases the log file and re-create it"""
@@ -681,54 +3905,230 @@ class FindRevDep(object):
         logf.write(writcontents)
         logf.close()
 
+    @timed_phase("check binaries")
     def print_broken_binfiles(self):
         """ Prints individual messages related to broken binary files """
 
         if self.dologreg:
             self.reset_log()
-        list_binary = self.find_bin_files()
         print "State of lacking .so dependencies: binary executables in ",
         for aaa in get_env_path():
             print aaa,
         print "\n"
-        for singularfile1 in list_binary:
-            listbin = self.get_list_notfound(singularfile1)
-            if not listbin:
-                continue
-            for singbin in listbin:
-                if self.dopredict:
-                    pkgonlyname1 = self.get_predicted_pkgname(singularfile1, \
-                                                              singbin)
-                    self.list_packages.append(pkgonlyname1)
-                linetowrite = "broken %40s  depends on: %15s" \
-                                  % (singularfile1, singbin)
-                print linetowrite
-                if self.dologreg:
-                    self.manage_log(linetowrite+"\n")
+        self.print_broken_results(self.iter_broken( \
+                                self.scan_files(self.iter_bin_files()),
+                                "binary"))
 
+    @timed_phase("check libraries")
     def print_broken_libfiles(self):
         """ Prints individual messages related to broken library files """
 
-        list_library = self.find_lib_files()
         print "\n\nState of lacking .so dependencies: shared libraries in ",
         for aaa in self.get_libdir():
             print aaa,
         print "\n"
-        for singularfile2 in list_library:
-            listlib = self.get_list_notfound(singularfile2)
-            if not listlib:
+        self.print_broken_results(self.iter_broken( \
+                                self.scan_files(self.iter_lib_files()),
+                                "library"))
+
+    @timed_phase("check changed libraries' consumers")
+    def print_broken_changedfiles(self):
+        """ Prints individual messages related to broken files who need
+            libraries given with '--changed'
+        """
+
+        affected = self.get_changed_sonames(self.list_changed)
+        if self.dologreg:
+            self.reset_log()
+        print "State of lacking .so dependencies: files who need ",
+        for aaa in self.list_changed:
+            print aaa,
+        print "\n"
+        self.print_broken_results(self.iter_broken( \
+                                self.scan_changed_files(affected), "changed"))
+
+    def scan_changed_files(self, affected):
+        """ Checks files who need a library of 'affected' (see
+            get_changed_sonames) like scan_files(); the other files keep
+            their cached results
+        """
+
+        for result in self.scan_files(self.iter_changed_consumers(affected)):
+            yield result
+        if not self.usecache:
+            return
+        for singfile, entry in self.scanstate.iteritems():
+            if singfile not in self.newscanstate:
+                self.newscanstate[singfile] = entry
+                for soname, libpath in entry[1] or []:
+                    if libpath in self.scanlibs and \
+                       libpath not in self.newscanlibs:
+                        self.newscanlibs[libpath] = self.scanlibs[libpath]
+
+    def get_broken_file(self, filename, listdep, kind):
+        """ Returns the BrokenFile record of 'filename', missing 'listdep'
+            (see scan_files), with its packages predicted (with prediction
+            on), which are added to the packages of the summary
+            -> BrokenFile
+        """
+
+        packages = []
+        if self.dopredict and listdep:
+            predicted = self.predict_pkgnames([(filename, singdep) for \
+                                               singdep in listdep])
+            for singdep in listdep:
+                pkgonlynames = predicted[filename, singdep]
+                self.list_packages.extend(pkgonlynames)
+                for package in pkgonlynames:
+                    if package != "unknown" and package not in packages:
+                        packages.append(package)
+        return BrokenFile(filename, kind, listdep, packages, self.displayroot)
+
+    def iter_broken(self, results, kind):
+        """ Yields a BrokenFile of 'kind' for every broken file of
+            (filename, list of missing .so) tuples yielded by scan_files()
+        """
+
+        for singfile, listdep in results:
+            if listdep is None or listdep:
+                yield self.get_broken_file(singfile, listdep, kind)
+
+    def iter_broken_files(self, roots=None, changed=None):
+        """ Library interface: checks files as the command line would, with
+            the options of this object (see getoptions), yielding a
+            BrokenFile for every broken one instead of printing it. 'roots'
+            and 'changed' replace roots and changed libraries given as
+            options. Records come as files are checked, with their
+            packages already predicted (with prediction on). The scan cache
+            is saved when it's over; loaded package indexes and predictions
+            are kept for the next call, and so are library lookups while
+            neither settings nor the libraries read change.
+        """
+
+        if roots is None:
+            roots = self.list_roots
+        if changed is None:
+            changed = self.list_changed
+        self.list_packages = []
+        return self.scan_broken_files(roots, changed)
+
+    def scan_broken_files(self, roots, changed):
+        """ Does the work of iter_broken_files() """
+
+        if roots:
+            if self.dopredict:
+                self.load_stock_pkgs()
+                self.load_sbo_pkgs()
+            self.sharecontent = len(roots) > 1
+            basedbdir = self.dbdir
+            try:
+                for root in roots:
+                    self.select_root(root, basedbdir)
+                    kind = None
+                    for message in self.iter_root_messages(root):
+                        if message[0] == "start":
+                            kind = message[1]
+                        elif message[0] == "broken":
+                            yield self.get_broken_file(message[1],
+                                                       message[2], kind)
+            finally:
+                self.select_root("", basedbdir)
+            return
+        self.forget_changed_lookups()
+        if changed:
+            results = self.iter_broken(self.scan_changed_files( \
+                            self.get_changed_sonames(changed)), "changed")
+        else:
+            results = itertools.chain( \
+                self.iter_broken(self.scan_files(self.iter_bin_files()),
+                                 "binary"),
+                self.iter_broken(self.scan_files(self.iter_lib_files()),
+                                 "library"))
+        for record in results:
+            yield record
+        self.save_scan_state()
+        self.save_snapshot()
+        # read again by the next scan, as it may have been made with other
+        # settings
+        self.scanstate = None
+        self.scanlibs = {}
+        self.newscanstate = {}
+        self.newscanlibs = {}
+        # library directories, soname index and lookups are kept unless
+        # the next scan finds that they changed
+        self.lastcontext = self.get_scan_context()
+        self.lastlookups = dict(self.identity_cache)
+        self.lastlookups[self.ldsocache] = get_file_identity(self.ldsocache)
+        for singdir in self.direntries:
+            self.lastlookups[singdir] = get_file_identity(singdir)
+
+    def forget_changed_lookups(self):
+        """ Forgets library directories, soname index and library lookups
+            of the previous scan of iter_broken_files() if its settings
+            (see get_scan_context), ld.so.cache, or libraries and
+            directories it read, changed since
+        """
+
+        if self.lastcontext is None:
+            return
+        if self.lastcontext != self.get_scan_context() or \
+           [aaa for aaa in self.lastlookups if get_file_identity(aaa) != \
+            self.lastlookups[aaa]]:
+            self.libdirs = None
+            self.sonameindex = None
+            self.forget_lib_lookups()
+        self.lastcontext = None
+        self.lastlookups = {}
+
+    def print_broken_results(self, records):
+        """ Prints (and logs) missing .so dependencies of BrokenFile
+            'records'
+        """
+
+        for record in records:
+            if record.missing is None:
+                self.print_timed_out(record.root + record.filename)
                 continue
-            for singlib in listlib:
-                if self.dopredict:
-                    pkgonlyname2 = self.get_predicted_pkgname(singularfile2, \
-                                                              singlib)
-                    self.list_packages.append(pkgonlyname2)
+            for singdep in record.missing:
                 linetowrite = "broken %40s  depends on: %15s" \
-                                  % (singularfile2, singlib)
+                                  % (record.root + record.filename, singdep)
                 print linetowrite
+                sys.stdout.flush()
                 if self.dologreg:
                     self.manage_log(linetowrite+"\n")
 
+    @timed_phase("check until broken")
+    def print_first_broken(self):
+        """ Checks files in iter_check_order() order until one of them is
+            broken (or ldd timed out on it), printing it -> True, or False
+            if no file is broken
+        """
+
+        if self.dologreg:
+            self.reset_log()
+        print "Looking for a broken file...\n"
+        results = self.scan_files(self.iter_check_order())
+        try:
+            for record in self.iter_broken(results, "file"):
+                self.print_broken_results([record])
+                # the scan cache is kept as it is
+                return True
+        finally:
+            results.close()
+        self.save_scan_state()
+        print "No broken file found."
+        return False
+
+    def print_timed_out(self, filename):
+        """ Prints (and logs) that ldd timed out on 'filename' """
+
+        linetowrite = "timeout %39s  ldd killed after %g seconds" \
+                          % (filename, self.lddtimeout)
+        print linetowrite
+        sys.stdout.flush()
+        if self.dologreg:
+            self.manage_log(linetowrite+"\n")
+
     def print_package_summary(self):
         """ Prints a summary with predicted packages """
 
@@ -754,7 +4154,591 @@ class FindRevDep(object):
                       "(only if library's ABI/API has not been modified.)"
                 if self.dologreg:
                     self.manage_log("\nPredicted packages:\n" + \
-                                    "".join(newlist_pkg)+"\n")
+                                    " ".join(newlist_pkg)+"\n")
+
+    def load_dep_graph(self):
+        """ Loads the dependency graph saved by the last check, once per
+            run --> DepGraph
+        """
+
+        if self.depgraph is not None:
+            return self.depgraph
+        graphfile = os.path.join(self.dbdir, self.depgraphdb)
+        if not os.path.exists(graphfile):
+            fatal_error("Dependency graph not found, it is saved by a " \
+                        "check run without '-n' or '--nocache' option.")
+        try:
+            self.depgraph = DepGraph(graphfile)
+        except (IOError, EOFError, ValueError, KeyError,
+                pickle.UnpicklingError):
+            fatal_error("Dependency graph is not valid, it is saved " \
+                        "again by a check run without '-n' or '--nocache'" \
+                        " option.")
+        return self.depgraph
+
+    def print_who_needs(self, libname):
+        """ Prints files who need library 'libname' (soname or path) """
+
+        depgraph = self.load_dep_graph()
+        if "/" in libname:
+            list_consumers = depgraph.find_consumers(list_paths=[libname])
+        else:
+            list_consumers = depgraph.find_consumers([libname])
+        print "Files who need %s:" % libname
+        for singfile in list_consumers:
+            print singfile
+        if not list_consumers:
+            print "No file."
+
+    def print_what_breaks(self, pkgname):
+        """ Prints files who would be broken by removing installed package
+            'pkgname': they load a library whose providers all belong to it
+        """
+
+        depgraph = self.load_dep_graph()
+        pkgfiles = set()
+        for recordpath in self.find_package_records(pkgname):
+            if os.path.dirname(recordpath) == self.pkg_install_dir:
+                pkgfiles.update(read_package_record(recordpath))
+        if not pkgfiles:
+            fatal_error("Package '%s' is not installed." % pkgname)
+        list_sonames = []
+        for soname in depgraph.sonames:
+            list_providers = depgraph.get_providers(soname)
+            if not list_providers:
+                continue
+            for provider in list_providers:
+                if provider not in pkgfiles and \
+                   depgraph.get_realpath(provider) not in pkgfiles:
+                    break
+            else:
+                list_sonames.append(soname)
+        list_broken = [singfile for singfile in \
+                       depgraph.find_consumers(list_sonames) if \
+                       singfile not in pkgfiles]
+        print "Files who would be broken by removing %s:" % pkgname
+        for singfile in list_broken:
+            print singfile
+        if not list_broken:
+            print "No file."
+
+    def print_closure(self, filename):
+        """ Prints libraries loaded by 'filename', directly or through
+            other libraries
+        """
+
+        list_solibs = self.load_dep_graph().get_closure(filename)
+        if list_solibs is None:
+            fatal_error("'%s' has not been checked, it is not in the " \
+                        "dependency graph." % filename)
+        print "Libraries loaded by %s:" % filename
+        for soname, libpath in list_solibs:
+            print "%s => %s" % (soname, libpath)
+        if not list_solibs:
+            print "No library."
+
+    def check_roots(self):
+        """ Checks files of every root given with '--root', one at a time,
+            printing (and logging) broken ones as usual
+        """
+
+        if self.dopredict:
+            # stock and SBo caches are the ones of this system
+            self.load_stock_pkgs()
+            self.load_sbo_pkgs()
+        if self.dologreg:
+            self.reset_log()
+        self.sharecontent = len(self.list_roots) > 1
+        basedbdir = self.dbdir
+        for root in self.list_roots:
+            self.select_root(root, basedbdir)
+            if not self.check_root(root):
+                print "\nRoot %s cannot be checked." % root
+        self.select_root("", basedbdir)
+
+    def select_root(self, root, basedbdir):
+        """ Makes files of 'root' ("" for this system) the ones checked,
+            with their own scan cache and package records cache in
+            'basedbdir'
+        """
+
+        if root:
+            self.dbdir = os.path.join(basedbdir, "roots",
+                                      hashlib.sha1(root).hexdigest())
+        else:
+            self.dbdir = basedbdir
+        self.pkg_install_dir = root + "/var/log/packages"
+        self.pkg_removed_dir = root + "/var/log/removed_packages"
+        self.installedindex = None
+        self.ownerpkgs = {}
+        self.displayroot = root
+
+    def check_root(self, root):
+        """ Checks files of 'root' (see iter_root_messages), printing what
+            it finds -> True, or False if the child process failed
+        """
+
+        kind = None
+        for message in self.iter_root_messages(root):
+            if message[0] == "start":
+                kind = message[1]
+                print "\n\nState of lacking .so dependencies: %s in " \
+                      % message[2],
+                for aaa in message[3]:
+                    print root + aaa,
+                print "\n"
+            elif message[0] == "broken":
+                self.print_broken_results([self.get_broken_file(message[1],
+                                                    message[2], kind)])
+            elif message[0] == "failed":
+                return False
+        return True
+
+    def iter_root_messages(self, root):
+        """ Checks files of 'root' in a child process chroot'ed into it
+            (see scan_root), yielding its "start" and "broken" messages as
+            they come, then ("failed",) if the child process failed
+        """
+
+        sys.stdout.flush()
+        readfd, writefd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(readfd)
+            status = 1
+            try:
+                try:
+                    self.scan_root(root, os.fdopen(writefd, "wb"))
+                    status = 0
+                except SystemExit:
+                    pass
+                except Exception, err:
+                    sys.stderr.write("Error checking %s: %s\n" % (root, err))
+            finally:
+                os._exit(status)
+        os.close(writefd)
+        handl = os.fdopen(readfd, "rb")
+        payload = None
+        try:
+            while True:
+                try:
+                    message = pickle.load(handl)
+                except EOFError:
+                    break
+                if message[0] == "end":
+                    payload = message[1]
+                else:
+                    yield message
+        finally:
+            handl.close()
+            os.waitpid(pid, 0)
+        if payload is None:
+            yield ("failed",)
+            return
+        self.add_content_info(payload["contentinfo"])
+        if self.stats is not None and payload["stats"] is not None:
+            self.stats.merge(payload["stats"])
+        if payload["scanstate"] is not None:
+            context, sonameindex, self.newscanstate, self.newscanlibs = \
+                                                    payload["scanstate"]
+            self.write_scan_state(context, sonameindex)
+            self.newscanstate = {}
+            self.newscanlibs = {}
+
+    def scan_root(self, root, handl):
+        """ Does the work of check_root() in the child process: chroot's
+            into 'root', so that its ld.so.conf, ld.so.cache and symlinks
+            are used, then checks its files and sends (pickled) to
+            'handl' ("start", kind of files, description, directories),
+            ("broken", filename, list of missing .so) and ("end", dict of
+            results to be kept by the parent) messages
+        """
+
+        def send(message):
+            """ Sends 'message' to the parent process """
+            pickle.dump(message, handl, protocol=2)
+            handl.flush()
+
+        state = None
+        savestate = False
+        if self.usecache:
+            state = self.read_scan_state()
+            savestate = not os.path.exists(os.path.join(self.dbdir,
+                                                        self.depgraphdb))
+        if self.jobs > 1 and multiprocessing is not None:
+            # made before chroot'ing, as it needs /dev/shm of this system:
+            # worker processes chroot themselves
+            self.pool = multiprocessing.Pool(self.jobs, init_scan_worker,
+                                             (self, root))
+        os.chroot(root)
+        os.chdir("/")
+        # environment of this system doesn't apply to the root
+        os.environ.pop("LD_LIBRARY_PATH", None)
+        if self.stats is not None:
+            self.stats = ScanStats()
+        self.newcontentinfo = {}
+        if self.usecache:
+            self.use_scan_state(state)
+        send(("start", "binary", "binary executables", get_env_path()))
+        for singfile, listdep in self.scan_files(self.iter_bin_files()):
+            if listdep:
+                send(("broken", singfile, listdep))
+        send(("start", "library", "shared libraries", self.get_libdir()))
+        for singfile, listdep in self.scan_files(self.iter_lib_files()):
+            if listdep:
+                send(("broken", singfile, listdep))
+        payload = {"contentinfo": self.newcontentinfo,
+                   "stats": self.stats, "scanstate": None}
+        if self.usecache and (savestate or self.scanstate_changed or \
+                              len(self.newscanstate) != len(self.scanstate)):
+            if self.sonameindex is None:
+                self.load_soname_index()
+            payload["scanstate"] = (self.get_scan_context(),
+                                    self.sonameindex, self.newscanstate,
+                                    self.newscanlibs)
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        send(("end", payload))
+        handl.close()
+
+    def is_checked_file(self, filename):
+        """ Returns True if 'filename' is a file who is checked by a full
+            run (an executable ELF file under $PATH or library directories
+            whose name is not masked), else False
+        """
+
+        if self.libdirs is None:
+            self.libdirs = self.get_libdir()
+        for list_dirs, forbidpattern in ((get_env_path(), BIN_MASK),
+                                         (self.libdirs, LIB_MASK)):
+            for singdir in list_dirs:
+                if filename.startswith(singdir.rstrip("/") + "/"):
+                    break
+            else:
+                continue
+            if multi_match_fileext(forbidpattern, filename):
+                continue
+            try:
+                statist = os.stat(filename)
+            except OSError:
+                return False
+            if stat.S_ISREG(statist.st_mode) and \
+               statist.st_mode & stat.S_IEXEC and \
+               isbinaryfile(filename, statist.st_size):
+                return True
+        return False
+
+    def update_broken_files(self, results):
+        """ Updates broken files known by the watch mode with (filename,
+            list of missing .so) tuples yielded by scan_files(), printing
+            (and logging) what changed
+        """
+
+        for singfile, listdep in results:
+            if listdep is None:
+                # left as it was
+                self.print_timed_out(singfile)
+                continue
+            oldlistdep = self.brokenfiles.get(singfile, [])
+            if listdep:
+                self.brokenfiles[singfile] = listdep
+            elif singfile in self.brokenfiles:
+                del self.brokenfiles[singfile]
+            for singdep in listdep or []:
+                if singdep in oldlistdep:
+                    continue
+                linetowrite = "broken %40s  depends on: %15s" \
+                                  % (singfile, singdep)
+                print linetowrite
+                if self.dologreg:
+                    self.manage_log(linetowrite+"\n")
+            for singdep in oldlistdep:
+                if singdep in (listdep or []):
+                    continue
+                linetowrite = "fixed  %40s  depends on: %15s" \
+                                  % (singfile, singdep)
+                print linetowrite
+                if self.dologreg:
+                    self.manage_log(linetowrite+"\n")
+        sys.stdout.flush()
+
+    def check_watched_files(self):
+        """ Checks every file again (at start, after a change of library
+            directories or after lost events) for the watch mode
+        """
+
+        if self.scanstate is not None:
+            # previous results were resolved with other settings
+            self.libdirs = None
+            self.sonameindex = None
+            self.forget_lib_lookups()
+            self.scanstate = {}
+            self.newscanstate = {}
+            self.newscanlibs = {}
+        if self.sonameindex is None:
+            # kept to find what a change of ld.so.cache changes
+            self.load_soname_index()
+        checked = set()
+        for singfile, listdep in self.scan_files(itertools.chain( \
+                            self.iter_bin_files(), self.iter_lib_files())):
+            checked.add(singfile)
+            self.update_broken_files([(singfile, listdep)])
+        for singfile in self.brokenfiles.keys():
+            if singfile not in checked:
+                self.update_broken_files([(singfile, [])])
+        if len(self.newscanstate) != len(self.scanstate):
+            self.scanstate_changed = True
+        # from now on, results are updated in place
+        self.scanstate = self.newscanstate
+        self.scanlibs = self.newscanlibs
+
+    def reload_soname_index(self):
+        """ Builds the soname index again (after a change of ld.so.conf or
+            ld.so.cache) -> set of sonames whose paths changed
+        """
+
+        oldindex = self.sonameindex or {}
+        self.direntries = {}
+        self.load_soname_index()
+        return diff_soname_indexes(oldindex, self.sonameindex)
+
+    def check_changed_files(self, changed, sonames=()):
+        """ Checks again, for the watch mode, files in 'changed' (a set of
+            paths who were created, modified or removed) and files who
+            load a library called as one of them or as one of 'sonames'
+        """
+
+        # symlinks to changed files have changed too
+        self.forget_lib_lookups()
+        for libpath, identity in self.newscanlibs.items():
+            if self.get_lib_identity(libpath) != identity:
+                # files who load it will be resolved again
+                del self.newscanlibs[libpath]
+        affected = set(sonames)
+        for singfile in changed:
+            affected.update(get_soname_keys(os.path.basename(singfile)))
+            elfinfo = read_elf_info(singfile)
+            if elfinfo is not None and elfinfo.soname:
+                affected.update(get_soname_keys(elfinfo.soname))
+        targets = set()
+        for singfile in changed:
+            if self.is_checked_file(singfile):
+                targets.add(singfile)
+            elif singfile in self.scanstate or singfile in self.brokenfiles:
+                # removed, or not checked anymore
+                self.scanstate.pop(singfile, None)
+                self.newscanstate.pop(singfile, None)
+                self.scanstate_changed = True
+                self.update_broken_files([(singfile, [])])
+        for singfile, entry in self.scanstate.iteritems():
+            for soname, libpath in entry[1] or []:
+                if soname in affected or libpath in changed:
+                    targets.add(singfile)
+                    break
+        self.update_broken_files(self.scan_files(sorted(targets)))
+
+    def write_watch_status(self):
+        """ Writes what is broken to the status file -> str (its contents) """
+
+        lines = ["# checked at %s, %d broken file(s)\n" % \
+                 (time.strftime("%Y-%m-%d %H:%M:%S"), len(self.brokenfiles))]
+        for singfile in sorted(self.brokenfiles):
+            for singdep in self.brokenfiles[singfile]:
+                lines.append("broken %40s  depends on: %15s\n" \
+                             % (singfile, singdep))
+        status = "".join(lines)
+        if not os.path.exists(self.dbdir):
+            os.mkdir(self.dbdir)
+        statusfile = os.path.join(self.dbdir, self.statusdb)
+        handl = open(statusfile + ".tmp", "w")
+        handl.write(status)
+        handl.close()
+        os.rename(statusfile + ".tmp", statusfile)
+        return status
+
+    def add_watch_tree(self, inotify, basedir):
+        """ Watches 'basedir' and its subdirectories (symlinked ones are
+            not followed, as walk_files() doesn't)
+        """
+
+        if not inotify.add_watch(basedir):
+            return
+        try:
+            names = os.listdir(basedir)
+        except OSError:
+            return
+        for fff in names:
+            path = os.path.join(basedir, fff)
+            if os.path.isdir(path) and not os.path.islink(path):
+                self.add_watch_tree(inotify, path)
+
+    def start_watches(self):
+        """ Watches directories of checked files, of ld.so.conf (and of
+            files it includes), of ld.so.cache and of installed package
+            records -> Inotify
+        """
+
+        try:
+            inotify = Inotify()
+        except OSError, err:
+            fatal_error("Watch mode cannot be started: %s." % err)
+        for singdir in get_env_path() + self.get_libdir():
+            self.add_watch_tree(inotify, singdir)
+        self.watched_ldconf = [os.path.dirname(self.ldsoconf),
+                               os.path.dirname(self.ldsocache)]
+        if os.path.isdir(self.ldsoconf + ".d"):
+            self.watched_ldconf.append(self.ldsoconf + ".d")
+        for singdir in self.watched_ldconf + [self.pkg_install_dir]:
+            inotify.add_watch(singdir)
+        return inotify
+
+    def is_ldconf_event(self, path):
+        """ Returns True if an event on 'path' may change how libraries
+            are found (ld.so.conf, its included files, ld.so.cache)
+        """
+
+        if path == self.ldsoconf or path == self.ldsocache:
+            return True
+        return os.path.dirname(path) == self.ldsoconf + ".d"
+
+    def watch_changes(self):
+        """ Checks every file, then checks again files who change (or whose
+            libraries change) until it is interrupted. What is broken is
+            kept in the status file and sent to every client connecting
+            to the watch socket.
+        """
+
+        inotify = self.start_watches()
+        if os.path.exists(self.watchsocket):
+            os.unlink(self.watchsocket)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.watchsocket)
+        server.listen(5)
+        signal.signal(signal.SIGTERM, stop_watching)
+        try:
+            print "Watching for changes, first check of every file:"
+            self.check_watched_files()
+            self.save_scan_state()
+            status = self.write_watch_status()
+            changed = set()
+            fullcheck = ldconfchanged = False
+            firstevent = lastevent = None
+            while True:
+                timeout = None
+                if firstevent is not None:
+                    timeout = max(0, min(lastevent + WATCH_QUIET,
+                                         firstevent + WATCH_MAXDELAY) - \
+                                     time.time())
+                try:
+                    readable = select.select([inotify.fd, server], [], [],
+                                             timeout)[0]
+                except select.error, err:
+                    if err[0] == errno.EINTR:
+                        continue
+                    raise
+                if server in readable:
+                    client = server.accept()[0]
+                    # a client who doesn't read must not block the watcher
+                    client.settimeout(WATCH_CLIENT_TIMEOUT)
+                    try:
+                        client.sendall(status)
+                    except (socket.error, socket.timeout):
+                        pass
+                    client.close()
+                if inotify.fd in readable:
+                    for mask, path in inotify.read_events():
+                        if path is None:
+                            # events were lost
+                            fullcheck = True
+                        elif self.is_ldconf_event(path):
+                            ldconfchanged = True
+                        elif os.path.dirname(path) == self.pkg_install_dir:
+                            # predictions must read records again
+                            self.installedindex = None
+                            self.ownerpkgs = {}
+                        elif mask & IN_ISDIR:
+                            if mask & (IN_CREATE | IN_MOVED_TO):
+                                self.add_watch_tree(inotify, path)
+                            changed.update(find_common_files(path))
+                            changed.update([aaa for aaa in self.scanstate \
+                                            if aaa.startswith(path + "/")])
+                        elif os.path.dirname(path) not in \
+                             self.watched_ldconf:
+                            changed.add(path)
+                        lastevent = time.time()
+                        if firstevent is None:
+                            firstevent = lastevent
+                if firstevent is None or (readable and \
+                   time.time() < min(lastevent + WATCH_QUIET,
+                                     firstevent + WATCH_MAXDELAY)):
+                    continue
+                if fullcheck or (ldconfchanged and \
+                                 self.get_libdir() != self.libdirs):
+                    # other directories are checked (and watched)
+                    inotify.close()
+                    inotify = self.start_watches()
+                    self.check_watched_files()
+                elif ldconfchanged:
+                    # e.g. ldconfig run by installpkg: only files who need
+                    # a library found elsewhere now are checked again
+                    self.check_changed_files(changed,
+                                             self.reload_soname_index())
+                elif changed:
+                    self.check_changed_files(changed)
+                self.save_scan_state()
+                status = self.write_watch_status()
+                changed = set()
+                fullcheck = ldconfchanged = False
+                firstevent = lastevent = None
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.unlink(self.watchsocket)
+            inotify.close()
+
+    def print_watch_status(self):
+        """ Prints what is broken, as known by a running watch mode (or
+            as last written in its status file)
+        """
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(self.watchsocket)
+            chunks = []
+            while True:
+                data = client.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+            client.close()
+            sys.stdout.write("".join(chunks))
+            return
+        except socket.error:
+            client.close()
+        statusfile = os.path.join(self.dbdir, self.statusdb)
+        if not os.path.exists(statusfile):
+            fatal_error("Watch mode is not running ('--watch' option).")
+        print "# watch mode is not running, last known status:"
+        handl = open(statusfile, "r")
+        sys.stdout.write(handl.read())
+        handl.close()
+
+    def print_stats(self, started):
+        """ Prints (and writes as JSON if asked) statistics of this run,
+            'started' being get_times() at its beginning
+        """
+
+        if self.stats is None:
+            return
+        if self.lddrunner is not None:
+            self.stats.count("ldd_runs", self.lddrunner.runs)
+            self.stats.count("ldd_runs_killed", self.lddrunner.killed)
+        self.stats.stop("total", started)
+        self.stats.print_summary()
+        if self.statsjson:
+            self.stats.write_json(self.statsjson)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding : iso-8859-1 -*-
+"""
+    test_pyfind_revdep - tests of pyfind_revdep library resolution,
+    ld.so.cache reading, SBo package matching and ldd output splitting.
+
+    Copyright (C) 2009  LukenShiro <lukenshiro@ngi.it>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, version 3 of the License.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    ELF fixtures are written by make_elf() of the benchmark, in a
+    temporary tree; run with 'python tests/test_pyfind_revdep.py'.
+"""
+
+import os
+import sys
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTDIR, ".."))
+sys.path.insert(0, os.path.join(TESTDIR, "..", "bench"))
+import pyfind_revdep
+from bench_pyfind_revdep import make_elf, SyntheticRevDep
+
+
+def write_ldsocache(filename, entries, fmt):
+    """ Writes an ld.so.cache listing (soname, path) 'entries' in 'fmt'
+        "old", "new" or "compat" (old format followed by the new one)
+    """
+
+    strtab = ""
+    offsets = []
+    for soname, libpath in entries:
+        offsets.append((len(strtab), len(strtab) + len(soname) + 1))
+        strtab += soname + "\0" + libpath + "\0"
+    if fmt == "old":
+        data = [pyfind_revdep.LDSOCACHE_OLD + "\0",
+                struct.pack("=I", len(entries))]
+        for keyoff, valoff in offsets:
+            data.append(struct.pack("=iII", 1, keyoff, valoff))
+        data.append(strtab)
+    else:
+        data = []
+        newstart = 0
+        if fmt == "compat":
+            # old entries are not read when the new format follows them
+            data.append(pyfind_revdep.LDSOCACHE_OLD + "\0")
+            data.append(struct.pack("=I", len(entries)))
+            data.append("\0" * 12 * len(entries))
+            oldend = 16 + 12 * len(entries)
+            newstart = (oldend + 7) & ~7
+            data.append("\0" * (newstart - oldend))
+        strstart = 48 + 24 * len(entries)
+        data.append(pyfind_revdep.LDSOCACHE_NEW)
+        data.append(struct.pack("=II", len(entries), len(strtab)))
+        data.append("\0" * 20)
+        for keyoff, valoff in offsets:
+            data.append(struct.pack("=iIIIQ", 0x303, strstart + keyoff,
+                                    strstart + valoff, 0, 0))
+        data.append(strtab)
+    handl = open(filename, "wb")
+    handl.write("".join(data))
+    handl.close()
+
+
+class FixtureTestCase(unittest.TestCase):
+    """ Temporary tree with ld.so.conf listing its 'lib64' directory """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyfind_revdep-test")
+        for singdir in ("etc", "lib64", "bin", "one", "two", "opt/app/bin",
+                        "opt/app/lib"):
+            os.makedirs(self.path(singdir))
+        handl = open(self.path("etc/ld.so.conf"), "w")
+        handl.write(self.path("lib64") + "\n")
+        handl.close()
+        self.ldlibpath = os.environ.pop("LD_LIBRARY_PATH", None)
+
+    def tearDown(self):
+        if self.ldlibpath is None:
+            os.environ.pop("LD_LIBRARY_PATH", None)
+        else:
+            os.environ["LD_LIBRARY_PATH"] = self.ldlibpath
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, relpath):
+        """ Returns 'relpath' in the temporary tree -> str """
+
+        return os.path.join(self.tmpdir, relpath)
+
+    def make_lib(self, relpath, needed=(), rpath=None, runpath=True):
+        """ Writes library 'relpath', its soname being its basename """
+
+        make_elf(self.path(relpath), needed,
+                 soname=os.path.basename(relpath), rpath=rpath,
+                 executable=False, runpath=runpath)
+
+    def make_scanner(self):
+        """ Returns a FindRevDep resolving libraries of the tree """
+
+        scanner = SyntheticRevDep()
+        scanner.ldsoconf = self.path("etc/ld.so.conf")
+        scanner.ldsocache = self.path("etc/ld.so.cache")
+        scanner.dbdir = self.path("db")
+        scanner.usecache = False
+        return scanner
+
+    def resolve(self, relpath):
+        """ Returns dict of soname -> path loaded by file 'relpath' """
+
+        return dict(self.make_scanner().get_native_sodep(self.path(relpath)))
+
+
+class NotFoundTest(FixtureTestCase):
+    """ Detection of missing libraries """
+
+    def test_missing_needed(self):
+        self.make_lib("lib64/libpfrta.so.1")
+        make_elf(self.path("bin/app"), ["libpfrta.so.1", "libpfrtgone.so.1"])
+        scanner = self.make_scanner()
+        self.assertEqual(scanner.get_list_notfound(self.path("bin/app")),
+                         ["libpfrtgone.so.1"])
+
+    def test_missing_through_library(self):
+        self.make_lib("lib64/libpfrta.so.1", ["libpfrtgone.so.1"])
+        make_elf(self.path("bin/app"), ["libpfrta.so.1"])
+        scanner = self.make_scanner()
+        self.assertEqual(scanner.get_list_notfound(self.path("bin/app")),
+                         ["libpfrtgone.so.1"])
+
+    def test_nothing_missing(self):
+        self.make_lib("lib64/libpfrta.so.1")
+        make_elf(self.path("bin/app"), ["libpfrta.so.1"])
+        scanner = self.make_scanner()
+        self.assertEqual(scanner.get_list_notfound(self.path("bin/app")), [])
+
+    def test_not_elf(self):
+        handl = open(self.path("bin/script"), "w")
+        handl.write("#!/bin/sh\n")
+        handl.close()
+        scanner = self.make_scanner()
+        self.assertEqual(scanner.get_native_sodep(self.path("bin/script")),
+                         "")
+
+
+class SearchOrderTest(FixtureTestCase):
+    """ Directories are searched in the dynamic loader's order """
+
+    def setUp(self):
+        FixtureTestCase.setUp(self)
+        self.make_lib("one/libpfrtdup.so.1")
+        self.make_lib("two/libpfrtdup.so.1")
+
+    def test_origin_runpath(self):
+        self.make_lib("opt/app/lib/libpfrtapp.so.1")
+        make_elf(self.path("opt/app/bin/tool"), ["libpfrtapp.so.1"],
+                 rpath="$ORIGIN/../lib")
+        self.assertEqual(self.resolve("opt/app/bin/tool")["libpfrtapp.so.1"],
+                         self.path("opt/app/bin/../lib/libpfrtapp.so.1"))
+        make_elf(self.path("bin/other"), ["libpfrtapp.so.1"])
+        self.assertEqual(self.resolve("bin/other")["libpfrtapp.so.1"],
+                         "not found")
+
+    def test_rpath_before_ld_library_path(self):
+        make_elf(self.path("bin/app"), ["libpfrtdup.so.1"],
+                 rpath=self.path("one"), runpath=False)
+        os.environ["LD_LIBRARY_PATH"] = self.path("two")
+        self.assertEqual(self.resolve("bin/app")["libpfrtdup.so.1"],
+                         self.path("one/libpfrtdup.so.1"))
+
+    def test_ld_library_path_before_runpath(self):
+        make_elf(self.path("bin/app"), ["libpfrtdup.so.1"],
+                 rpath=self.path("one"))
+        os.environ["LD_LIBRARY_PATH"] = self.path("two")
+        self.assertEqual(self.resolve("bin/app")["libpfrtdup.so.1"],
+                         self.path("two/libpfrtdup.so.1"))
+
+    def test_executable_rpath_applies_to_libraries(self):
+        self.make_lib("lib64/libpfrtmid.so.1", ["libpfrtdup.so.1"])
+        make_elf(self.path("bin/app"), ["libpfrtmid.so.1"],
+                 rpath=self.path("one"), runpath=False)
+        self.assertEqual(self.resolve("bin/app")["libpfrtdup.so.1"],
+                         self.path("one/libpfrtdup.so.1"))
+
+    def test_runpath_only_applies_to_its_object(self):
+        self.make_lib("lib64/libpfrtmid.so.1", ["libpfrtdup.so.1"])
+        make_elf(self.path("bin/app"), ["libpfrtmid.so.1"],
+                 rpath=self.path("one"))
+        self.assertEqual(self.resolve("bin/app")["libpfrtdup.so.1"],
+                         "not found")
+
+    def test_runpath_before_ldsocache(self):
+        cached = self.path("two/libpfrtdup.so.1")
+        write_ldsocache(self.path("etc/ld.so.cache"),
+                        [("libpfrtdup.so.1", cached)], "new")
+        make_elf(self.path("bin/app"), ["libpfrtdup.so.1"],
+                 rpath=self.path("one"))
+        make_elf(self.path("bin/other"), ["libpfrtdup.so.1"])
+        self.assertEqual(self.resolve("bin/app")["libpfrtdup.so.1"],
+                         self.path("one/libpfrtdup.so.1"))
+        self.assertEqual(self.resolve("bin/other")["libpfrtdup.so.1"],
+                         cached)
+
+
+class LdsoCacheTest(FixtureTestCase):
+    """ Both ld.so.cache formats are read """
+
+    entries = [("libpfrta.so.1", "/usr/lib64/libpfrta.so.1"),
+               ("libpfrtb.so.2", "/lib64/libpfrtb.so.2"),
+               ("libpfrta.so.1", "/usr/lib/libpfrta.so.1")]
+    expected = {"libpfrta.so.1": ["/usr/lib64/libpfrta.so.1",
+                                  "/usr/lib/libpfrta.so.1"],
+                "libpfrtb.so.2": ["/lib64/libpfrtb.so.2"]}
+
+    def check_format(self, fmt):
+        """ Checks a cache written in 'fmt' is read as written """
+
+        filename = self.path("etc/ld.so.cache")
+        write_ldsocache(filename, self.entries, fmt)
+        self.assertEqual(pyfind_revdep.read_ldsocache(filename),
+                         self.expected)
+
+    def test_old_format(self):
+        self.check_format("old")
+
+    def test_new_format(self):
+        self.check_format("new")
+
+    def test_compat_format(self):
+        self.check_format("compat")
+
+    def test_unusable(self):
+        filename = self.path("etc/ld.so.cache")
+        self.assertEqual(pyfind_revdep.read_ldsocache(filename), None)
+        handl = open(filename, "wb")
+        handl.write("not a cache")
+        handl.close()
+        self.assertEqual(pyfind_revdep.read_ldsocache(filename), None)
+
+    def test_listing_without_cache(self):
+        self.make_lib("lib64/libpfrta.so.1")
+        scanner = self.make_scanner()
+        scanner.load_soname_index()
+        self.assertEqual(scanner.sonameindex["libpfrta.so.1"],
+                         [self.path("lib64/libpfrta.so.1")])
+
+
+class SboMatcherTest(unittest.TestCase):
+    """ The matcher finds what a substring search of every name finds """
+
+    def test_against_substring_search(self):
+        rand = random.Random(2009)
+        names = []
+        while len(names) < 200:
+            name = "".join([rand.choice("abcAB+-") for aaa in
+                            range(rand.randint(1, 5))])
+            if name.lower() not in [aaa.lower() for aaa in names]:
+                names.append(name)
+        matcher = pyfind_revdep.SboMatcher(names)
+        for aaa in range(500):
+            text = "lib" + "".join([rand.choice("abcABC+-.") for bbb in
+                                    range(rand.randint(0, 12))]) + ".so.1"
+            expected = [name for name in names if
+                        name.lower() in text.lower()]
+            expected.sort(key=lambda name: (-len(name), names.index(name)))
+            self.assertEqual(matcher.find_matches(text), expected)
+
+    def test_saved_state(self):
+        matcher = pyfind_revdep.SboMatcher(["SDL", "SDL_image", "gtk"])
+        loaded = pyfind_revdep.SboMatcher(state=matcher.as_dict())
+        self.assertEqual(loaded.find_matches("libSDL_image-1.2.so.0"),
+                         ["SDL_image", "SDL"])
+
+    def test_case_duplicates(self):
+        matcher = pyfind_revdep.SboMatcher(["Qt", "qt"])
+        self.assertEqual(matcher.find_matches("libqt-mt.so.3"), ["Qt"])
+
+
+class SplitLddOutputTest(unittest.TestCase):
+    """ ldd output of several files is split by file """
+
+    def test_single_file(self):
+        output = "\tlibc.so.6 => /lib64/libc.so.6 (0x00007f0000000000)\n"
+        self.assertEqual(pyfind_revdep.split_ldd_output(output, ["/bin/a"]),
+                         [output])
+
+    def test_several_files(self):
+        output = "/bin/a:\n" \
+                 "\tlibx.so.1 => not found\n" \
+                 "/bin/b:\n" \
+                 "\tnot a dynamic executable\n" \
+                 "/bin/c:\n" \
+                 "\tliby.so.2 => /lib64/liby.so.2 (0x00007f0000000000)\n"
+        self.assertEqual(pyfind_revdep.split_ldd_output(output,
+                                        ["/bin/a", "/bin/b", "/bin/c"]),
+                         ["\tlibx.so.1 => not found\n",
+                          "\tnot a dynamic executable\n",
+                          "\tliby.so.2 => /lib64/liby.so.2 "
+                          "(0x00007f0000000000)\n"])
+
+    def test_unknown_header_and_silent_file(self):
+        output = "/bin/a:\n" \
+                 "\tlibx.so.1 => not found\n" \
+                 "/bin/other:\n" \
+                 "/bin/c:\n" \
+                 "\tliby.so.2 => not found\n"
+        self.assertEqual(pyfind_revdep.split_ldd_output(output,
+                                        ["/bin/a", "/bin/b", "/bin/c"]),
+                         ["\tlibx.so.1 => not found\n/bin/other:\n", "",
+                          "\tliby.so.2 => not found\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()